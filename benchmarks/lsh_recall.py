@@ -0,0 +1,98 @@
+"""Recall of the LSH candidate index against the exhaustive srt_similarity search
+
+For every line of every film of the config, the exhaustive matches are the covered French events with
+a similarity over REQ_SIM. The benchmark reports the share of them the LSH candidates contain, the share
+of lines whose best match is among the candidates, and the time spent per line by both searches.
+
+Usage: python -m benchmarks.lsh_recall --config-filename tests/TestSubTraductorV3.conf
+"""
+import argparse, time
+import numpy as np
+from rich.console import Console
+from rich.table import Table
+
+from src.interface import Config
+from src.config_actions import load_config
+from src.timecode_finder import TimecodesFinder, REQ_SIM
+from src.matching import QuickRatioEngine, shared_lsh_index
+
+
+def lsh_recall(config: Config) -> Table:
+    table = Table(title=f"LSH recall ({config.matching.lsh_bands} bands x {config.matching.lsh_rows} rows, top-k {config.matching.top_k})")
+    for column in ["Film", "Lines", "Matches", "Recall", "Best recall", "Candidates/line", "Exhaustive ms/line", "LSH ms/line"]:
+        table.add_column(column)
+
+    start = time.perf_counter()
+    lsh_index = shared_lsh_index(config)
+    build_time = time.perf_counter() - start
+
+    for film in config.films_to_build:
+        finder = TimecodesFinder(config, film.file_name)
+        # same scores as srt_similarity, vectorized so the exhaustive search stays affordable
+        engine = QuickRatioEngine(finder.fr_subs)
+        paths = set(finder.fr_subs_by_path.keys())
+        positions = [(sub_file.path, j) for sub_file in finder.fr_subs for j in range(len(sub_file.events))]
+
+        lines = matches = found = best_lines = best_found = candidates_count = 0
+        exhaustive_time = lsh_time = 0.0
+
+        for normalized in finder.films_normalized:
+            if len(normalized) < lsh_index.n:
+                continue
+            lines += 1
+
+            start = time.perf_counter()
+            similarities = engine.corpus_similarities(normalized)
+            relevant = np.flatnonzero(similarities > REQ_SIM)
+            exhaustive_time += time.perf_counter() - start
+
+            start = time.perf_counter()
+            candidates = set(lsh_index.candidates(normalized, config.matching.top_k, paths))
+            lsh_time += time.perf_counter() - start
+
+            candidates_count += len(candidates)
+            matches += len(relevant)
+            found += sum(positions[k] in candidates for k in relevant)
+            if len(relevant):
+                best_lines += 1
+                best_found += positions[int(np.argmax(similarities))] in candidates
+
+        table.add_row(
+            str(film.number),
+            str(lines),
+            str(matches),
+            f"{found / max(1, matches):.1%}",
+            f"{best_found / max(1, best_lines):.1%}",
+            f"{candidates_count / max(1, lines):.1f}",
+            f"{1000 * exhaustive_time / max(1, lines):.3f}",
+            f"{1000 * lsh_time / max(1, lines):.3f}",
+        )
+
+    table.caption = f"index of {len(lsh_index)} events built in {build_time:.2f}s"
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall of the LSH candidate index against the exhaustive search")
+    parser.add_argument("--config-filename", type=str, default="tests/TestSubTraductorV3.conf")
+    parser.add_argument("--bands", type=int, help="LSH bands (default: config \"lsh-bands\")")
+    parser.add_argument("--rows", type=int, help="LSH rows per band (default: config \"lsh-rows\")")
+    parser.add_argument("--top-k", type=int, help="candidates per line (default: config \"top-k\")")
+    args = parser.parse_args()
+
+    config = load_config(args.config_filename)
+    if config is None:
+        return
+
+    if args.bands is not None:
+        config.matching.lsh_bands = args.bands
+    if args.rows is not None:
+        config.matching.lsh_rows = args.rows
+    if args.top_k is not None:
+        config.matching.top_k = args.top_k
+
+    Console().print(lsh_recall(config))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""Time and memory of SubBuilder.build_subs on generated episodes and timecodes
+
+The episodes are written in a temporary folder, then the film sub is built from random timecodes
+(a few events each) with tracemalloc running: peak memory and memory blocks allocated are reported.
+SubBuilder.remove_duplicate is also measured alone on a generated output of --dedup-events events.
+
+Usage: python -m benchmarks.sub_builder --episodes 24 --events 400 --timecodes 300 --dedup-events 20000
+"""
+import os, time, random, argparse, tempfile, tracemalloc
+from typing import Callable, List
+import pysubs2
+from rich.console import Console
+from rich.table import Table
+
+from src.interface import Config, Timecode
+from src.sub_builder import SubBuilder
+
+FILM_NAME = "Bench Kai 01.ass"
+EVENT_DURATION = 1500
+EVENT_GAP = 2000
+
+
+def generate_episodes(path: str, episodes: int, events: int) -> None:
+    os.makedirs(path)
+    for number in range(1, episodes + 1):
+        subs = pysubs2.SSAFile()
+        for k in range(events):
+            subs.append(pysubs2.SSAEvent(start=k * EVENT_GAP, end=k * EVENT_GAP + EVENT_DURATION, text=f"Episode {number} line {k}"))
+        subs.save(os.path.join(path, f"Bench {number:02d}.ass"))
+
+
+def generate_timecodes(episodes: int, events: int, count: int, rng: random.Random) -> List[Timecode]:
+    timecodes: List[Timecode] = []
+    for _ in range(count):
+        first = rng.randrange(events - 10)
+        length = rng.randint(1, 10)
+        # windows cut inside events, like the timecodes found in a film
+        start = first * EVENT_GAP + rng.randrange(EVENT_DURATION)
+        end = (first + length) * EVENT_GAP + rng.randrange(EVENT_DURATION)
+        timecodes.append(Timecode(start=start, end=end, ms_shift=rng.randrange(-60000, 60000), sub_file_name=f"Bench {rng.randint(1, episodes):02d}.ass"))
+    return timecodes
+
+
+def measure(function: Callable[[], None]) -> tuple[float, int, int]:
+    """Seconds, peak memory and memory blocks still allocated after function"""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    start = time.perf_counter()
+    function()
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    blocks = sum(stat.count_diff for stat in tracemalloc.take_snapshot().compare_to(before, "filename"))
+    tracemalloc.stop()
+    return seconds, peak, blocks
+
+
+def bench_build_subs(root: str, episodes: int, events: int, timecodes_count: int) -> Table:
+    to_build_path = os.path.join(root, "to-build", "Bench")
+    generate_episodes(to_build_path, episodes, events)
+
+    config = Config(**{
+        "films-path": os.path.join(root, "films"),
+        "subs-to-translate-path": os.path.dirname(to_build_path),
+        "save-path": os.path.join(root, "out"),
+        "films-to-build": [{"file-name": FILM_NAME, "number": 1, "covered-episodes": [f"1-{episodes}"]}],
+    })
+    timecodes = generate_timecodes(episodes, events, timecodes_count, random.Random(0))
+    builder = SubBuilder(config, to_build_path, FILM_NAME, timecodes)
+
+    seconds, peak, blocks = measure(lambda: builder.build_subs(0))
+
+    table = Table(title=f"build_subs: {episodes} episodes of {events} events, {timecodes_count} timecodes")
+    for column in ["Seconds", "Peak memory (KiB)", "Blocks allocated"]:
+        table.add_column(column)
+    table.add_row(f"{seconds:.3f}", f"{peak / 1024:.0f}", str(blocks))
+    return table
+
+
+def generate_output(events: int, rng: random.Random) -> pysubs2.SSAFile:
+    """Built sub with the defects remove_duplicate cleans: exact duplicates, same text overlaps, short events"""
+    subs = pysubs2.SSAFile()
+    for k in range(events):
+        start = k * 500
+        subs.append(pysubs2.SSAEvent(start=start, end=start + rng.choice([50, 1500, 2000]), text=f"line {k}"))
+        if rng.random() < 0.1:
+            subs.append(pysubs2.SSAEvent(start=start + rng.choice([0, 300]), end=start + 1500, text=f"line {k}"))
+    return subs
+
+
+def bench_remove_duplicate(events: int) -> Table:
+    subs = generate_output(events, random.Random(0))
+    count = len(subs)
+
+    seconds, peak, blocks = measure(lambda: SubBuilder.remove_duplicate(None, subs))
+
+    table = Table(title=f"remove_duplicate: {count} events, {count - len(subs)} removed")
+    for column in ["Seconds", "Peak memory (KiB)", "Blocks allocated"]:
+        table.add_column(column)
+    table.add_row(f"{seconds:.3f}", f"{peak / 1024:.0f}", str(blocks))
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time and memory of SubBuilder.build_subs")
+    parser.add_argument("--episodes", type=int, default=24)
+    parser.add_argument("--events", type=int, default=400)
+    parser.add_argument("--timecodes", type=int, default=300)
+    parser.add_argument("--dedup-events", type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        Console().print(bench_build_subs(root, args.episodes, args.events, args.timecodes))
+    Console().print(bench_remove_duplicate(args.dedup_events))
+
+
+if __name__ == '__main__':
+    main()
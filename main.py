@@ -147,6 +147,7 @@ def main():
                         help="Create mkv files with new translated subs.")
     parser.add_argument("--cut", nargs='?', type=str, const="SubTraductorV3.conf", help=argparse.SUPPRESS)
     parser.add_argument("--single-thread", nargs='?', const=True, type=bool, help="Run the translation in a single thread.")
+    parser.add_argument("--workers", type=int, help="Number of films translated in parallel (default: config \"workers\", one per CPU).")
     parser.add_argument("--sync-sub", nargs='?', const=True, type=bool, help="Tool to help Sync subtitles. can display the shift and apply it.\nWork for only 1 shift between files.\nBetter performance with same language subs but can work with different language subs.")
     parser.add_argument("--mkv-extract", nargs='?', const=True, type=bool, help="Extract ASS/SRT subtitles from MKV files.\nIn case of SRT the file will be convert to ASS")
     parser.add_argument("--v2", nargs='?', const=True, type=bool, help="One Piece V2 helper for Livai")
@@ -199,6 +200,9 @@ def main():
     
     logger.debug(config.log())
 
+    if args.workers is not None:
+        config.workers = args.workers
+
     numbers = input("Enter films to translate (1,2,3), nothing for all films: ").replace(" ", "").split(",")
     if len(numbers) > 0 and numbers[0] != "":
         config.films_to_build = [film for film in config.films_to_build if str(film.number) in numbers]
@@ -0,0 +1,106 @@
+import re, sys, pysubs2
+from typing import List, Optional
+from pysubs2.formats import autodetect_format
+from pysubs2.formats.substation import SECTION_HEADING
+from pysubs2.time import TIMESTAMP, TIMESTAMP_SHORT, timestamp_to_ms
+
+from src.interface import SubFile, CompactEvent, EventExtra
+
+
+# H:MM:SS.cc, the timestamp every ass writer writes
+SHORT_TIMESTAMP = re.compile(r"\d:\d\d:\d\d\.\d\d")
+
+
+def parse_timestamp(value: str) -> int:
+    """Milliseconds of an event timestamp, parsed like pysubs2 parses it"""
+    if SHORT_TIMESTAMP.fullmatch(value):
+        digits = int(value[0] + value[2:4] + value[5:7] + value[8:])
+        return digits // 1000000 * 3600000 + digits // 10000 % 100 * 60000 + digits % 10000 * 10
+
+    value = value.strip()
+    sign = 1
+    if value.startswith("-"):
+        value = value[1:]
+        sign = -1
+
+    m = TIMESTAMP.match(value)
+    if m is None:
+        m = TIMESTAMP_SHORT.match(value)
+        if m is None:
+            raise ValueError(f"Failed to parse timestamp: {value!r}")
+    return sign * timestamp_to_ms(m.groups())
+
+
+def parse_styles(style_lines: List[str]) -> dict[str, pysubs2.SSAStyle]:
+    """Styles of the Style lines of a file, parsed by pysubs2"""
+    if not style_lines:
+        return {}
+    return pysubs2.SSAFile.from_string("[V4+ Styles]\n" + "\n".join(style_lines), format_="ass").styles
+
+
+def read_ass(path: str, styles=True) -> Optional[SubFile]:
+    """Episode ass file read in one go, the events parsed straight into CompactEvent, see parse_ass"""
+    with open(path, encoding="utf-8") as file:
+        return parse_ass(file.read(), path, styles)
+
+
+def parse_ass(text: str, path: str, styles=True) -> Optional[SubFile]:
+    """Episode of the text of an ass file, newlines already translated like a file opened in text mode
+
+    Gives the info, styles and events pysubs2.load gives, without building a SSAEvent per line.
+    Without styles the Style lines are skipped: the matching only reads the events, only the built episodes need them.
+    Returns None for a file this reader does not handle (another format, attachments, a line pysubs2 would
+    parse with defaults or reject): load it with pysubs2
+    """
+    try:
+        if autodetect_format(text[:10000]) != "ass":
+            return None
+    except Exception:
+        return None
+
+    info: dict[str, str] = {}
+    aegisub_project: dict[str, str] = {}
+    style_lines: List[str] = []
+    events: List[CompactEvent] = []
+    # EventExtra of the raw fields of the file, its lines share a handful of them
+    extras: dict[tuple, EventExtra] = {}
+
+    inside_info_section = inside_aegisub_section = False
+    try:
+        for line in text.split("\n"):
+            line = line.strip()
+
+            # the event lines first, nearly every line of an episode is one
+            if line.startswith(("Dialogue:", "Comment:")) and not (inside_info_section or inside_aegisub_section):
+                ev_type, rest = line.split(":", 1)
+                fields = rest.strip().split(",", 9)
+                if len(fields) < 10:
+                    return None
+                layer, start, end, style, name, marginl, marginr, marginv, effect, event_text = fields
+                extra_key = (ev_type, layer, name, marginl, marginr, marginv, effect)
+                extra = extras.get(extra_key)
+                if extra is None:
+                    extra = extras[extra_key] = EventExtra(int(layer), name, int(marginl), int(marginr), int(marginv), effect, ev_type, False)
+                events.append(CompactEvent(parse_timestamp(start), parse_timestamp(end), sys.intern(style), event_text, extra))
+            elif "[" in line[:4] and SECTION_HEADING.match(line):
+                if "Fonts" in line or "Graphics" in line:
+                    return None
+                inside_info_section = "Info" in line
+                inside_aegisub_section = "Aegisub" in line
+            elif inside_info_section or inside_aegisub_section:
+                if line.startswith(";"):
+                    continue
+                k, sep, v = line.partition(":")
+                if sep:
+                    (info if inside_info_section else aegisub_project)[k] = v.strip()
+            elif styles and line.startswith("Style:"):
+                style_lines.append(line)
+    except ValueError:
+        return None
+
+    subs = pysubs2.SSAFile()
+    subs.format = "ass"
+    subs.info = info
+    subs.aegisub_project = aegisub_project
+    subs.styles = parse_styles(style_lines) if styles else {}
+    return SubFile(pysub_file=subs, path=path, events=events)
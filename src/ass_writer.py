@@ -0,0 +1,54 @@
+import pysubs2
+from typing import Any, Iterable, Iterator
+from pysubs2.formats.substation import SubstationFormat, NOTICE, STYLE_FORMAT_LINE, STYLE_FIELDS, EVENT_FORMAT_LINE, color_to_ass_rgba
+
+# written files are buffered by this many bytes, the events are formatted line by line
+WRITE_BUFFER = 1 << 16
+
+ms_to_timestamp = SubstationFormat.ms_to_timestamp
+
+
+def style_field(value: Any) -> str:
+    """Style field written like pysubs2 writes an ass file"""
+    if isinstance(value, pysubs2.Alignment):
+        return str(value.value)
+    if isinstance(value, bool):
+        return "-1" if value else "0"
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, float):
+        return str(int(value) if value.is_integer() else value)
+    if isinstance(value, pysubs2.Color):
+        return color_to_ass_rgba(value)
+    return value
+
+
+def ass_lines(info: dict[str, str], styles: dict[str, pysubs2.SSAStyle], events: Iterable[pysubs2.SSAEvent]) -> Iterator[str]:
+    yield "[Script Info]\n"
+    for line in NOTICE.splitlines(False):
+        yield f"; {line}\n"
+
+    info = dict(info)
+    info["ScriptType"] = "v4.00+"
+    for key, value in info.items():
+        yield f"{key}: {value}\n"
+
+    yield "\n[V4+ Styles]\n"
+    yield STYLE_FORMAT_LINE["ass"] + "\n"
+    for name, style in styles.items():
+        yield ",".join([f"Style: {name}"] + [style_field(getattr(style, field)) for field in STYLE_FIELDS["ass"]]) + "\n"
+
+    yield "\n[Events]\n"
+    yield EVENT_FORMAT_LINE["ass"] + "\n"
+    for event in events:
+        yield (f"{event.type}: {event.layer},{ms_to_timestamp(event.start)},{ms_to_timestamp(event.end)},{event.style},"
+               f"{event.name},{event.marginl},{event.marginr},{event.marginv},{event.effect},{event.text}\n")
+
+
+def write_ass(path: str, info: dict[str, str], styles: dict[str, pysubs2.SSAStyle], events: Iterable[pysubs2.SSAEvent]) -> None:
+    """Write an ass file line by line, the same bytes as SSAFile.save of a file with these info, styles and events
+
+    The built subs have no Aegisub project, fonts or graphics section, so none is written
+    """
+    with open(path, "w", encoding="utf-8", buffering=WRITE_BUFFER) as file:
+        file.writelines(ass_lines(info, styles, events))
@@ -1,6 +1,7 @@
 import os, json, logging
 from rich.prompt import Prompt
 
+from src.constants import CACHE_FOLDER
 from src.interface import Config, FilmInfos
 from src.tools.fandom_scrapper import ask_for_fandom_serie, FandomSerie
 
@@ -64,6 +65,7 @@ def generate_config(config_file_path: str) -> Config:
     config.fr_subs_path = Prompt.ask("Enter path of french subtitles", default=f"{base_path}/French", show_default=True).strip()
     config.subs_to_translate_path = Prompt.ask("Enter path of the sub subtitles to translate", default=f"{base_path}/to-translate", show_default=True).strip()
     config.save_path = Prompt.ask("Enter path to save the translated subtitles", default=f"{base_path}/translated", show_default=True).strip()
+    config.cache_path = f"{base_path}/{CACHE_FOLDER}"
 
     logger.rich(f"[green italic]Config file populated![/green italic]\n", level=logging.INFO)
     logger.debug(config.log())
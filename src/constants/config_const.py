@@ -6,6 +6,7 @@ FILMS_PATH: Final[str] = "bc/film"
 FR_SUBS_FOLDER: Final[str] = "french"
 SUBS_TO_TRANSLATE_FOLDER: Final[str] = "to-translate"
 SAVE_FOLDER = "translated-subs"
+CACHE_FOLDER: Final[str] = ".timecodes-cache"
 
 # Film Infos
 FILE_NAME: Final[str] = "film-name"
@@ -1,8 +1,11 @@
-import re, pysubs2, logging
+import re, string, pysubs2, logging
 from typing import List, Union
 
 logger = logging.getLogger(__name__)
 
+TAGS_PATTERN = re.compile(r'\{.*?\}')
+PUNCTUATION_TABLE = str.maketrans('', '', string.punctuation)
+
 def extract_first_number(string):
     # Search for the first occurrence of a number in the string
     match = re.search(r'\d+', string)
@@ -14,6 +17,18 @@ def extract_first_number(string):
         return None
     
 
+def normalize_sub_text(text: str) -> str:
+    """Strip override tags, case and punctuation so two lines can be compared
+
+    Args:
+        text (str): raw text of a subtitle event
+
+    Returns:
+        str: the normalized text used by the similarity functions
+    """
+    return TAGS_PATTERN.sub('', text).lower().strip().translate(PUNCTUATION_TABLE)
+
+
 def shift(sub: pysubs2.SSAEvent, ms_shift: int):
     sub.start += ms_shift
     sub.end += ms_shift
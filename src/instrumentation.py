@@ -0,0 +1,109 @@
+import os, json, time, logging, threading
+from contextlib import contextmanager, nullcontext
+from typing import Iterator, List
+
+from src.interface import Config, Stats
+
+logger = logging.getLogger(__name__)
+
+INSTRUMENTATION_FILE = "instrumentation.json"
+
+
+class Instrumentation:
+    """Counters and wall time of the phases of one film: matching, then building each language
+
+    Phases are named with slashes ("build/English/slice"), their time and number of calls add up.
+    The languages of a film can be built in threads sharing the instrumentation, every record takes the lock
+    """
+
+    enabled = True
+
+    def __init__(self) -> None:
+        self.counters: dict[str, int] = {}
+        self.phases: dict[str, dict[str, float]] = {}
+        self.run_lengths: dict[int, int] = {}
+        self.lock = threading.Lock()
+
+    def count(self, name: str, n: int = 1) -> None:
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def run(self, length: int) -> None:
+        """A matched run of length film lines"""
+        with self.lock:
+            self.run_lengths[length] = self.run_lengths.get(length, 0) + 1
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            with self.lock:
+                phase = self.phases.setdefault(name, {"seconds": 0.0, "calls": 0})
+                phase["seconds"] += seconds
+                phase["calls"] += 1
+
+    def merge(self, report: dict) -> None:
+        """Add the report of an instrumentation recorded in another process"""
+        with self.lock:
+            for name, n in report.get("counters", {}).items():
+                self.counters[name] = self.counters.get(name, 0) + n
+            for name, phase in report.get("phases", {}).items():
+                total = self.phases.setdefault(name, {"seconds": 0.0, "calls": 0})
+                total["seconds"] += phase["seconds"]
+                total["calls"] += phase["calls"]
+            for length, n in report.get("run-lengths", {}).items():
+                self.run_lengths[length] = self.run_lengths.get(length, 0) + n
+
+    def report(self) -> dict:
+        with self.lock:
+            return {
+                "counters": dict(sorted(self.counters.items())),
+                "phases": {name: {"seconds": round(phase["seconds"], 6), "calls": phase["calls"]} for name, phase in self.phases.items()},
+                "run-lengths": dict(sorted(self.run_lengths.items())),
+            }
+
+
+class NullInstrumentation(Instrumentation):
+    """Instrumentation disabled, every record is a no-op"""
+
+    enabled = False
+
+    def count(self, name: str, n: int = 1) -> None:
+        pass
+
+    def run(self, length: int) -> None:
+        pass
+
+    def phase(self, name: str) -> nullcontext:
+        return NULL_PHASE
+
+    def merge(self, report: dict) -> None:
+        pass
+
+    def report(self) -> dict:
+        return {}
+
+
+NULL_PHASE = nullcontext()
+NULL_INSTRUMENTATION = NullInstrumentation()
+
+
+def create_instrumentation(config: Config) -> Instrumentation:
+    return Instrumentation() if config.instrumentation else NULL_INSTRUMENTATION
+
+
+def save_instrumentation_report(config: Config, results: List[Stats]) -> None:
+    """Write the instrumentation of every film in a JSON report in the save path, next to the Stats table"""
+    if not config.instrumentation:
+        return
+
+    report = {stats.film: stats.instrumentation for stats in results if stats is not None}
+    report_path = os.path.join(config.save_path, INSTRUMENTATION_FILE)
+    os.makedirs(config.save_path, exist_ok=True)
+    with open(report_path, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2, sort_keys=True)
+
+    logger.rich(f"Instrumentation report saved: [green]{report_path}[/]")
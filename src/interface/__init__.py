@@ -1,9 +1,11 @@
 from src.interface.config import *
 from src.interface.stats import *
+from src.interface.events import *
 
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
+from typing import List
 import pysubs2, os, logging
-from src.helpers import extract_first_number
+from src.helpers import extract_first_number, normalize_sub_text
 
 
 logger = logging.getLogger(__name__)
@@ -80,19 +82,41 @@ class Timecode(BaseModel):
         return os.path.basename(self.sub_file_name)
 
 class SubFile(BaseModel):
+    # info and styles of the file, its events are in events
     pysub_file: pysubs2.SSAFile
     path: str
     episode_number: int
+    events: List[CompactEvent] = Field(default=[])
+    normalized_texts: List[str] = Field(default=[])
 
-    def __init__(self, pysub_file: pysubs2.SSAFile, path: str):
+    def __init__(self, pysub_file: pysubs2.SSAFile, path: str, events: List[CompactEvent] = None):
         number = extract_first_number(os.path.basename(path))
-        super().__init__(pysub_file=pysub_file, path=path, episode_number=number)
+        if events is None:
+            events = compact_events(pysub_file.events)
+        super().__init__(pysub_file=sub_file_header(pysub_file), path=path, episode_number=number, events=events)
     model_config = ConfigDict(arbitrary_types_allowed=True)
 
     @property
     def basename(self):
         return os.path.basename(self.path)
-    
+
+    def normalize_texts(self) -> None:
+        """Compute once the normalized text of every event, in the current events order"""
+        self.normalized_texts = [normalize_sub_text(event.text) for event in self.events]
+
+
+def sub_file_header(subs: pysubs2.SSAFile) -> pysubs2.SSAFile:
+    """SSAFile with the sections of subs but its events, the dicts are shared"""
+    header = pysubs2.SSAFile()
+    header.info = subs.info
+    header.styles = subs.styles
+    header.aegisub_project = subs.aegisub_project
+    header.fonts_opaque = subs.fonts_opaque
+    header.graphics_opaque = subs.graphics_opaque
+    header.fps = subs.fps
+    header.format = subs.format
+    return header
+
 
 class Cut(BaseModel):
     film_time: Time
@@ -1,6 +1,6 @@
 import os
 from pydantic import BaseModel, model_validator, Field, field_validator, field_serializer, ConfigDict
-from typing import List, Union, Optional
+from typing import List, Union, Optional, Literal
 from pathlib import Path
 from rich.table import Table
 from rich.console import Console
@@ -33,6 +33,38 @@ class FilmInfos(BaseModel):
         return unparse_covered_episodes(covered_episodes)
 
 
+class MatchingConfig(BaseModel):
+    # "ngram" compare each film line only with the top-k French events sharing the most n-grams
+    # "lsh" same with a MinHash LSH index built once for all the films of the config
+    candidate_index: Literal["none", "ngram", "lsh"] = Field(alias="candidate-index", default="none")
+    top_k: int = Field(alias="top-k", default=50)
+    lsh_bands: int = Field(alias="lsh-bands", default=20)
+    lsh_rows: int = Field(alias="lsh-rows", default=2)
+    # "locality" first search around the last match (same episode, then the neighbouring episode numbers)
+    search: Literal["full", "locality"] = Field(alias="search", default="full")
+    locality_window: int = Field(alias="locality-window", default=30)
+    locality_episodes: int = Field(alias="locality-episodes", default=1)
+    # "listdir" search the episodes in loading order (by episode number), "adaptive" search the episodes of
+    # the last match first, then its neighbours, then the episodes matched the most in the last recent-matches
+    # runs, then the others in loading order
+    episode_order: Literal["listdir", "adaptive"] = Field(alias="episode-order", default="listdir")
+    recent_matches: int = Field(alias="recent-matches", default=8)
+    # "numpy" compute the similarities of a film line with a whole episode at once, same scores as "python"
+    similarity_backend: Literal["python", "numpy"] = Field(alias="similarity-backend", default="python")
+    # > 1: the film lines are cut in chunks searched in parallel worker processes, same result as 1
+    # each worker loads the film and the episodes again, worth it only for films searched in several seconds
+    film_chunks: int = Field(alias="film-chunks", default=1)
+
+    # on a line not found, look for it as two French lines joined or as one French line split in two film lines
+    combine: bool = Field(alias="combine", default=False)
+
+    # "dp" align the whole film at once (banded dynamic programming) instead of the greedy search
+    engine: Literal["greedy", "dp"] = Field(alias="engine", default="greedy")
+    band: int = Field(alias="band", default=8) # candidates kept per film line by the "dp" engine
+
+    model_config = ConfigDict(populate_by_name = True)
+
+
 class Config(BaseModel):
     films_path: str = Field(alias="films-path", default=FILMS_PATH)
     fr_subs_path: str = Field(alias="fr-subs-path", default="")
@@ -42,6 +74,29 @@ class Config(BaseModel):
         alias="films-to-build", 
         default=[] # FilmInfos(**{"file-name": FILE_NAME, "number": -1, "covered-episodes": COVERED_EPISODES})
     )
+    matching: MatchingConfig = Field(alias="matching", default_factory=MatchingConfig)
+    # multithread translation: "thread" translates every film in a thread, "process" in a spawned worker process
+    # that keeps its logs in memory until the film is done
+    parallel_mode: Literal["process", "thread"] = Field(alias="parallel-mode", default="thread")
+    workers: int = Field(alias="workers", default=0) # 0: one worker per CPU
+    # the subs of every language are built while the timecodes are found instead of after
+    stream_build: bool = Field(alias="stream-build", default=False)
+    # subs of the languages of a film, built from the same build plan: "thread" builds them concurrently,
+    # "process" in worker processes that receive the plan as plain tuples
+    build_mode: Literal["serial", "thread", "process"] = Field(alias="build-mode", default="serial")
+    build_workers: int = Field(alias="build-workers", default=0) # 0: one worker per language, at most one per CPU for "process"
+    # timecodes of already matched films are kept on disk in cache-path (next to the films folder by default),
+    # keyed by the hash of the film and french subs and by ALGORITHM_VERSION of the search
+    timecodes_cache: bool = Field(alias="timecodes-cache", default=False)
+    cache_path: str = Field(alias="cache-path", default="")
+    # parsed episodes kept in memory for the other films and languages of the run, least recently used evicted past episode-cache-mb
+    episode_cache: bool = Field(alias="episode-cache", default=False)
+    episode_cache_mb: int = Field(alias="episode-cache-mb", default=512)
+    # episode files read by a thread pool and parsed by a process pool, for slow disks and network shares
+    parallel_loading: bool = Field(alias="parallel-loading", default=False)
+    loading_workers: int = Field(alias="loading-workers", default=0) # 0: one parsing process per CPU
+    # counters and phase timings of the matching and building, saved in save-path/instrumentation.json
+    instrumentation: bool = Field(alias="instrumentation", default=False)
 
     @field_validator('save_path', mode='before')
     def validate_save_path(cls, v, info):
@@ -66,6 +121,9 @@ class Config(BaseModel):
 
         if not self.subs_to_translate_path:
             self.subs_to_translate_path = os.path.join(os.path.dirname(self.films_path), SUBS_TO_TRANSLATE_FOLDER)
+
+        if not self.cache_path:
+            self.cache_path = os.path.join(os.path.dirname(self.films_path), CACHE_FOLDER)
         
     def is_to_build(self, film_sub_name) -> bool:
         return any(film.file_name == film_sub_name for film in self.films_to_build)
@@ -0,0 +1,65 @@
+import sys, pysubs2
+from operator import attrgetter
+from typing import Iterable, List, NamedTuple, Optional
+
+
+class EventExtra(NamedTuple):
+    """Fields of an event the matching and the building never change, one tuple shared by the events of a file with the same values"""
+    layer: int
+    name: str
+    marginl: int
+    marginr: int
+    marginv: int
+    effect: str
+    type: str
+    marked: bool
+
+
+class CompactEvent:
+    """Event of a loaded episode or film: times, style and text in slots, the other fields in a shared EventExtra
+
+    Reads like a pysubs2.SSAEvent for every field, about 80 bytes against 390 for its attribute dict: a loaded
+    file takes about 1.5x less memory, its texts dominate. The loaded events stay CompactEvent up to the ass
+    writer, which formats them directly
+    """
+
+    __slots__ = ("start", "end", "style", "text", "extra")
+
+    def __init__(self, start: int, end: int, style: str, text: str, extra: EventExtra) -> None:
+        self.start = start
+        self.end = end
+        self.style = style
+        self.text = text
+        self.extra = extra
+
+    layer = property(attrgetter("extra.layer"))
+    name = property(attrgetter("extra.name"))
+    marginl = property(attrgetter("extra.marginl"))
+    marginr = property(attrgetter("extra.marginr"))
+    marginv = property(attrgetter("extra.marginv"))
+    effect = property(attrgetter("extra.effect"))
+    type = property(attrgetter("extra.type"))
+    marked = property(attrgetter("extra.marked"))
+
+    @staticmethod
+    def from_ssa(event: pysubs2.SSAEvent, extras: Optional[dict[EventExtra, EventExtra]] = None) -> "CompactEvent":
+        """Compact copy of the event, its EventExtra shared through extras with the events already converted"""
+        extra = EventExtra(event.layer, event.name, event.marginl, event.marginr, event.marginv, event.effect, event.type, event.marked)
+        if extras is not None:
+            extra = extras.setdefault(extra, extra)
+        return CompactEvent(event.start, event.end, sys.intern(event.style), event.text, extra)
+
+    def to_ssa(self) -> pysubs2.SSAEvent:
+        return pysubs2.SSAEvent(start=self.start, end=self.end, style=self.style, text=self.text, **self.extra._asdict())
+
+    def copy(self) -> "CompactEvent":
+        return CompactEvent(self.start, self.end, self.style, self.text, self.extra)
+
+    def __repr__(self) -> str:
+        return f"CompactEvent({self.start}, {self.end}, {self.style!r}, {self.text!r})"
+
+
+def compact_events(events: Iterable[pysubs2.SSAEvent]) -> List[CompactEvent]:
+    # the EventExtra are shared by the events of the file only, they go away with it (evicted from the episode cache)
+    extras: dict[EventExtra, EventExtra] = {}
+    return [CompactEvent.from_ssa(event, extras) for event in events]
@@ -8,6 +8,25 @@ from rich.style import Style
 
 logger = logging.getLogger(__name__)
 
+class SearchStats(BaseModel):
+    # film lines matched inside the locality window / film lines that needed the full search
+    locality_hits: int = Field(default=0)
+    locality_misses: int = Field(default=0)
+    # similarities computed / skipped because the lengths of the texts can't reach the threshold
+    comparisons: int = Field(default=0)
+    skipped_comparisons: int = Field(default=0)
+    # film lines searched / episodes they looked into before a match (or the end of the search)
+    searched_lines: int = Field(default=0)
+    episodes_visited: int = Field(default=0)
+    # lines not found searched as combined lines / found that way
+    combine_searches: int = Field(default=0)
+    combine_found: int = Field(default=0)
+
+    def add(self, other: 'SearchStats') -> None:
+        for name in type(self).model_fields:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+
 class Stats(BaseModel):
     film: str = Field(default="")
 
@@ -15,6 +34,8 @@ class Stats(BaseModel):
     not_found: int = Field(default=0)
     total_to_find: int = Field(default=0)
     subs_not_found: list[str] = Field(default=[])
+    search: SearchStats = Field(default_factory=SearchStats)
+    instrumentation: dict = Field(default={}) # report of the film when the config enables the instrumentation
 
     @property
     def quality(self) -> float:
@@ -23,6 +44,13 @@ class Stats(BaseModel):
     def __init__(self, film: str, total_to_find: int) -> None:
         super().__init__(film=film, total_to_find=total_to_find)
 
+    def add(self, other: 'Stats') -> None:
+        """Add the lines found and not found of other, used to merge the stats of partial searches"""
+        self.found += other.found
+        self.not_found += other.not_found
+        self.subs_not_found.extend(other.subs_not_found)
+        self.search.add(other.search)
+
     def __str__(self) -> str:
         return f"{self.film} : {self.found}/{self.total_to_find} found"
     
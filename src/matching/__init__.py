@@ -0,0 +1,6 @@
+from src.matching.ngram_index import *
+from src.matching.quick_ratio_engine import *
+from src.matching.length_index import *
+from src.matching.combine_index import *
+from src.matching.lsh_index import *
+from src.matching.alignment import *
@@ -0,0 +1,108 @@
+import logging
+from typing import List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# scores of the alignment, a matched line is worth its similarity minus MATCH_BASE, an unmatched line 0
+MATCH_BASE = 0.5
+TIMING_BONUS = 0.1  # the line continues the previous one with the same shift (see helpers.right_shift)
+SKIP_PENALTY = 0.1  # the line continues the previous one skipping one episode line
+JUMP_PENALTY = 0.3  # the line jumps elsewhere in the same episode
+EPISODE_JUMP_PENALTY = 0.4  # the line jumps to another episode
+RESTART_PENALTY = 0.4  # the line is matched after an unmatched line
+
+SHIFT_TOLERANCE = 120  # ms, same as right_shift
+
+
+class AlignmentCandidate(NamedTuple):
+    path: str # french sub file
+    j: int # event index in the french sub file
+    similarity: float
+    shift: int # film event middle time - french event middle time
+
+
+def is_continuation(first: AlignmentCandidate, previous: AlignmentCandidate, candidate: AlignmentCandidate) -> bool:
+    """The candidate follows the previous one in the same episode with the shift of the run started at first,
+    so it is in the same timecode (written with the shift of first)"""
+    return previous.path == candidate.path and 0 < candidate.j - previous.j <= 2 and abs(candidate.shift - first.shift) < SHIFT_TOLERANCE
+
+
+def align(lines: List[List[AlignmentCandidate]]) -> List[Optional[AlignmentCandidate]]:
+    """Best alignment of the film lines on the french events (Viterbi over the candidates of every line)
+
+    Every film line is either matched to one of its candidates or left unmatched. Following the
+    previous line in the same episode is free (bonus when the shift is the same), jumping elsewhere
+    costs a penalty. The best previous state for a jump is kept per episode and overall so every
+    line costs O(band) with band the number of candidates per line.
+
+    Args:
+        lines (List[List[AlignmentCandidate]]): candidates of every film line
+
+    Returns:
+        List[Optional[AlignmentCandidate]]: the chosen candidate of every film line, None when unmatched
+    """
+    if not lines:
+        return []
+
+    # back pointers: index of the previous state for every candidate, -1 for the unmatched state
+    candidates_back: List[List[int]] = []
+    unmatched_back: List[int] = []
+
+    previous: List[AlignmentCandidate] = []
+    previous_scores: List[float] = []
+    unmatched_score = 0.0
+
+    for candidates in lines:
+        by_position = {(c.path, c.j): k for k, c in enumerate(previous)}
+        best_by_episode: dict[str, int] = {}
+        best = -1
+        for k, c in enumerate(previous):
+            if c.path not in best_by_episode or previous_scores[k] > previous_scores[best_by_episode[c.path]]:
+                best_by_episode[c.path] = k
+            if best < 0 or previous_scores[k] > previous_scores[best]:
+                best = k
+
+        scores: List[float] = []
+        back: List[int] = []
+        for candidate in candidates:
+            options = [(unmatched_score - RESTART_PENALTY, -1)]
+            if best >= 0:
+                options.append((previous_scores[best] - EPISODE_JUMP_PENALTY, best))
+            if candidate.path in best_by_episode:
+                k = best_by_episode[candidate.path]
+                options.append((previous_scores[k] - JUMP_PENALTY, k))
+
+            for gap, penalty in ((1, 0), (2, SKIP_PENALTY)):
+                k = by_position.get((candidate.path, candidate.j - gap))
+                if k is not None:
+                    bonus = TIMING_BONUS if abs(candidate.shift - previous[k].shift) < SHIFT_TOLERANCE else 0
+                    options.append((previous_scores[k] - penalty + bonus, k))
+
+            score, k = max(options)
+            scores.append(score + candidate.similarity - MATCH_BASE)
+            back.append(k)
+
+        # staying unmatched is free
+        if best >= 0 and previous_scores[best] > unmatched_score:
+            unmatched_back.append(best)
+            unmatched_score = previous_scores[best]
+        else:
+            unmatched_back.append(-1)
+
+        candidates_back.append(back)
+        previous, previous_scores = candidates, scores
+
+    # backtrack from the best final state
+    result: List[Optional[AlignmentCandidate]] = [None] * len(lines)
+    state = -1
+    if previous_scores and max(previous_scores) > unmatched_score:
+        state = previous_scores.index(max(previous_scores))
+
+    for i in range(len(lines) - 1, -1, -1):
+        if state >= 0:
+            result[i] = lines[i][state]
+            state = candidates_back[i][state]
+        else:
+            state = unmatched_back[i]
+
+    return result
@@ -0,0 +1,84 @@
+from difflib import SequenceMatcher
+from typing import List, Optional, Tuple
+
+from src.interface import SubFile, CompactEvent, SearchStats
+from src.helpers import normalize_sub_text
+from src.instrumentation import Instrumentation, NULL_INSTRUMENTATION
+from src.matching.length_index import LengthIndex
+
+
+def combine_text(*texts: str) -> str:
+    """Normalized concatenation of subtitle texts, line breaks removed like the combine search always did"""
+    return normalize_sub_text("".join(texts).replace("\\N", ""))
+
+
+class CombineIndex:
+    """Texts of the combine search, normalized once per film
+
+    A film line can be two French events joined (the film merged them) or two film lines one French
+    event (the film split it). Every French event is stored alone and joined with the next one, every
+    film line alone and joined with the next one, so a combine search is two length-pruned scans
+    of precomputed strings, like a single-line lookup.
+    """
+
+    def __init__(self, sub_files: List[SubFile], film_events: List[CompactEvent], instrumentation: Instrumentation = NULL_INSTRUMENTATION) -> None:
+        self.instrumentation = instrumentation
+        self.singles: dict[str, List[str]] = {}
+        self.pairs: dict[str, List[str]] = {}
+        for sub_file in sub_files:
+            events = sub_file.events
+            self.singles[sub_file.path] = [combine_text(event.text) for event in events]
+            self.pairs[sub_file.path] = [combine_text(event.text, following.text) for event, following in zip(events, events[1:])]
+
+        self.singles_lengths = LengthIndex(self.singles)
+        self.pairs_lengths = LengthIndex(self.pairs)
+
+        self.film_singles: List[str] = [combine_text(event.text) for event in film_events]
+        self.film_pairs: List[str] = [combine_text(event.text, following.text) for event, following in zip(film_events, film_events[1:])]
+
+    def search(self, i: int, sub_files: List[SubFile], threshold: float, search_stats: SearchStats) -> Optional[Tuple[SubFile, int, float, bool]]:
+        """Best combine match of the film line i over the threshold
+
+        Args:
+            i (int): film line searched
+            sub_files (List[SubFile]): episodes, in search order
+            threshold (float): similarity the match has to be over
+            search_stats (SearchStats): counts the similarities computed and skipped
+
+        Returns:
+            Optional[Tuple[SubFile, int, float, bool]]: episode, index of the French event, similarity and
+            whether the film line i + 1 is part of the match (split line), None when nothing is over the threshold
+        """
+        film_single = self.film_singles[i]
+        film_pair = self.film_pairs[i] if i < len(self.film_pairs) else None
+        best: Tuple[SubFile, int, float, bool] = None
+        best_similarity = threshold
+
+        for sub_file in sub_files:
+            # film line against two French events joined
+            merged = self.similarities(film_single, sub_file.path, self.pairs, self.pairs_lengths, threshold, search_stats) if film_single else {}
+            # two film lines joined against one French event
+            split = self.similarities(film_pair, sub_file.path, self.singles, self.singles_lengths, threshold, search_stats) if film_pair else {}
+
+            for j in sorted(merged.keys() | split.keys()):
+                merged_similarity, split_similarity = merged.get(j, 0), split.get(j, 0)
+                similarity = max(merged_similarity, split_similarity)
+                if similarity > best_similarity:
+                    best = (sub_file, j, similarity, merged_similarity != similarity)
+                    best_similarity = similarity
+
+        return best
+
+    def similarities(self, film_text: str, path: str, texts: dict[str, List[str]], lengths: LengthIndex, threshold: float, search_stats: SearchStats) -> dict[int, float]:
+        path_texts = texts[path]
+        indexes = lengths.prune(path, range(len(path_texts)), len(film_text), threshold)
+        search_stats.comparisons += len(indexes)
+        search_stats.skipped_comparisons += len(path_texts) - len(indexes)
+        self.instrumentation.count("similarity_calls", len(indexes))
+
+        similarities: dict[int, float] = {}
+        for j in indexes:
+            similarity = SequenceMatcher(None, film_text, path_texts[j]).quick_ratio()
+            if similarity > threshold:
+                similarities[j] = similarity
+        return similarities
@@ -0,0 +1,62 @@
+import numpy as np
+from typing import List, Sequence, Tuple
+
+# lengths are compared with a small margin so float rounding never prunes a reachable event
+LENGTH_EPSILON = 1e-9
+
+
+def length_bounds(length: int, threshold: float) -> Tuple[float, float]:
+    """Lengths of the texts whose quick_ratio with a text of this length can be over the threshold
+
+    quick_ratio counts at most min(la, lb) matching characters, so it is bounded by
+    2 * min(la, lb) / (la + lb), which is over the threshold only between these two lengths
+    """
+    if threshold <= 0:
+        return 0, float("inf")
+    return threshold * length / (2 - threshold) - LENGTH_EPSILON, length * (2 - threshold) / threshold + LENGTH_EPSILON
+
+
+class LengthIndex:
+    """Lengths of the normalized texts of every episode, also sorted to find a length range by bisection
+
+    Built from {episode path: normalized texts}, the French events or any text derived from them
+    """
+
+    def __init__(self, texts: dict[str, List[str]]) -> None:
+        self.lengths: dict[str, np.ndarray] = {}
+        self.order: dict[str, np.ndarray] = {}
+        self.sorted_lengths: dict[str, np.ndarray] = {}
+
+        for path, path_texts in texts.items():
+            lengths = np.array([len(text) for text in path_texts], dtype=np.int64)
+            order = np.argsort(lengths, kind="stable")
+            self.lengths[path] = lengths
+            self.order[path] = order
+            self.sorted_lengths[path] = lengths[order]
+
+    def prune(self, path: str, indexes: Sequence[int], length: int, threshold: float) -> Sequence[int]:
+        """Keep the indexes of the texts whose length can reach the threshold, in the same order
+
+        Args:
+            path (str): episode of the texts
+            indexes (Sequence[int]): indexes of the texts to compare, in scan order
+            length (int): length of the normalized film line
+            threshold (float): similarity the events have to be over
+
+        Returns:
+            Sequence[int]: indexes left, `indexes` itself when none is pruned
+        """
+        low, high = length_bounds(length, threshold)
+
+        if isinstance(indexes, range) and indexes.step == 1 and len(indexes) == len(self.lengths[path]):
+            sorted_lengths = self.sorted_lengths[path]
+            first = np.searchsorted(sorted_lengths, low, side="left")
+            last = np.searchsorted(sorted_lengths, high, side="right")
+            kept = np.sort(self.order[path][first:last])
+        else:
+            lengths = self.lengths[path][np.asarray(indexes, dtype=np.int64)]
+            kept = np.asarray(indexes, dtype=np.int64)[(lengths >= low) & (lengths <= high)]
+
+        if len(kept) == len(indexes):
+            return indexes
+        return kept.tolist()
@@ -0,0 +1,148 @@
+import logging
+import threading
+import zlib
+import numpy as np
+from typing import Container, List, Tuple
+
+from src.interface import Config, SubFile
+from src.sub_files_loader import load_sub_files, list_sub_files, file_version, episode_cache, loading_workers
+from src.matching.ngram_index import NGRAM_SIZE, text_ngrams
+
+logger = logging.getLogger(__name__)
+
+LSH_PRIME = (1 << 31) - 1
+LSH_SEED = 20240817
+LSH_CHUNK = 4096 # events hashed at once when the index is built
+
+
+class MinHashLshIndex:
+    """MinHash signatures of the n-gram sets of the French events, banded in hash buckets
+
+    Two events land in the same bucket of a band when the `rows` minhashes of the band are equal,
+    which happens with probability jaccard^rows, so a film line only looks at the buckets of its
+    own signature instead of the whole corpus. Candidates are the events sharing at least one
+    bucket, ranked by the estimated jaccard (share of equal minhashes).
+
+    Events are stored as (path, index) so one index can be shared by the TimecodesFinder of every film
+    """
+
+    def __init__(self, sub_files: List[SubFile], bands: int, rows: int, n: int = NGRAM_SIZE) -> None:
+        self.n = n
+        self.bands = bands
+        self.rows = rows
+
+        rng = np.random.default_rng(LSH_SEED)
+        self.a = rng.integers(1, LSH_PRIME, size=bands * rows, dtype=np.uint64)
+        self.b = rng.integers(0, LSH_PRIME, size=bands * rows, dtype=np.uint64)
+
+        self.paths: List[str] = [sub_file.path for sub_file in sub_files]
+        self.positions: List[Tuple[str, int]] = []
+        position_paths: List[int] = []
+        texts: List[str] = []
+        for path_id, sub_file in enumerate(sub_files):
+            for j, normalized in enumerate(sub_file.normalized_texts):
+                self.positions.append((sub_file.path, j))
+                position_paths.append(path_id)
+                texts.append(normalized)
+        self.position_paths = np.array(position_paths, dtype=np.int32)
+
+        self.signatures = np.empty((len(texts), bands * rows), dtype=np.uint32)
+        for start in range(0, len(texts), LSH_CHUNK):
+            self.signatures[start:start + LSH_CHUNK] = self.signatures_of(texts[start:start + LSH_CHUNK])
+
+        # events without any n-gram have no signature, they can't be retrieved
+        indexed = np.array([len(text) > 0 for text in texts], dtype=bool)
+        self.buckets: List[dict[bytes, np.ndarray]] = []
+        for band in range(bands):
+            keys = self.signatures[:, band * rows:(band + 1) * rows]
+            bucket: dict[bytes, list[int]] = {}
+            for position in np.flatnonzero(indexed):
+                bucket.setdefault(keys[position].tobytes(), []).append(position)
+            self.buckets.append({key: np.array(ids, dtype=np.int32) for key, ids in bucket.items()})
+
+        logger.info(f"LSH index built: {len(self.positions)} events, {bands} bands of {rows} rows")
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def signatures_of(self, texts: List[str]) -> np.ndarray:
+        """MinHash signatures of normalized texts, one row per text (max values for an empty text)"""
+        owners: List[int] = []
+        hashes: List[int] = []
+        for owner, text in enumerate(texts):
+            for ngram in text_ngrams(text, self.n):
+                owners.append(owner)
+                hashes.append(zlib.crc32(ngram.encode("utf-8")) % LSH_PRIME)
+
+        signatures = np.full((len(texts), len(self.a)), np.iinfo(np.uint32).max, dtype=np.uint32)
+        if not hashes:
+            return signatures
+
+        owners = np.array(owners, dtype=np.int64)
+        permuted = (np.array(hashes, dtype=np.uint64)[:, None] * self.a + self.b) % LSH_PRIME
+
+        # n-grams of a text are contiguous, reduce them per owner
+        starts = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]])
+        signatures[owners[starts]] = np.minimum.reduceat(permuted, starts, axis=0).astype(np.uint32)
+        return signatures
+
+    def candidates(self, normalized: str, top_k: int, paths: Container[str] = None) -> List[Tuple[str, int]]:
+        """Return the top_k events sharing a bucket with the normalized text, in index (episode then event) order
+
+        Args:
+            normalized (str): normalized text of the film line
+            top_k (int): maximum number of candidates
+            paths (Container[str], optional): only return events of these episodes. Defaults to all.
+
+        Returns:
+            List[Tuple[str, int]]: (episode path, event index) pairs to compare with srt_similarity
+        """
+        if not normalized:
+            return []
+
+        signature = self.signatures_of([normalized])[0]
+        matched = []
+        for band, bucket in enumerate(self.buckets):
+            ids = bucket.get(signature[band * self.rows:(band + 1) * self.rows].tobytes())
+            if ids is not None:
+                matched.append(ids)
+        if not matched:
+            return []
+
+        hits = np.unique(np.concatenate(matched))
+        if paths is not None:
+            allowed = np.array([path in paths for path in self.paths], dtype=bool)
+            hits = hits[allowed[self.position_paths[hits]]]
+
+        if len(hits) > top_k:
+            scores = (self.signatures[hits] == signature).sum(axis=1)
+            hits = hits[np.argpartition(scores, -top_k)[-top_k:]]
+            # keep the scan order so the first acceptable match wins like in the exhaustive search
+            hits.sort()
+
+        return [self.positions[position] for position in hits]
+
+
+shared_lsh_indexes: dict[tuple, tuple[tuple, MinHashLshIndex]] = {}
+shared_lsh_lock = threading.Lock()
+
+
+def shared_lsh_index(config: Config) -> MinHashLshIndex:
+    """LSH index over the French episodes covered by any film of the config, built once per run
+
+    The films translated in threads share the same index, each worker process builds its own. The index
+    is built again when a French file is edited or replaced, the positions would point at the old events
+    """
+    covered_episodes = sorted({number for film in config.films_to_build for number in film.covered_episodes})
+    key = (config.fr_subs_path, tuple(covered_episodes), config.matching.lsh_bands, config.matching.lsh_rows)
+    versions = tuple((sub_path, file_version(sub_path)) for sub_path in list_sub_files(config.fr_subs_path, covered_episodes))
+
+    with shared_lsh_lock:
+        if key not in shared_lsh_indexes or shared_lsh_indexes[key][0] != versions:
+            sub_files = load_sub_files(config.fr_subs_path, covered_episodes, cache=episode_cache(config), workers=loading_workers(config))
+            # same event order and texts as the TimecodesFinder of each film
+            for sub_file in sub_files:
+                sub_file.events.sort(key=lambda e: e.start)
+                sub_file.normalize_texts()
+            shared_lsh_indexes[key] = (versions, MinHashLshIndex(sub_files, config.matching.lsh_bands, config.matching.lsh_rows))
+        return shared_lsh_indexes[key][1]
@@ -0,0 +1,76 @@
+import logging
+import numpy as np
+from typing import List, Tuple
+
+from src.interface import SubFile
+
+logger = logging.getLogger(__name__)
+
+NGRAM_SIZE = 3
+
+
+def text_ngrams(normalized: str, n: int = NGRAM_SIZE) -> set[str]:
+    """Character n-grams of a normalized text, a text shorter than n is its own n-gram"""
+    if len(normalized) < n:
+        return {normalized} if normalized else set()
+    return {normalized[k:k + n] for k in range(len(normalized) - n + 1)}
+
+
+class NgramIndex:
+    """Inverted index from character n-grams to the French events containing them
+
+    Built once per film over the covered episodes, it gives for a film line the top-K
+    (episode, index) pairs sharing the most n-grams so only those go through srt_similarity
+    """
+
+    def __init__(self, sub_files: List[SubFile], n: int = NGRAM_SIZE) -> None:
+        self.n = n
+        self.positions: List[Tuple[SubFile, int]] = []
+
+        postings: dict[str, list[int]] = {}
+        ngrams_count: list[int] = []
+
+        for sub_file in sub_files:
+            for j, normalized in enumerate(sub_file.normalized_texts):
+                position = len(self.positions)
+                self.positions.append((sub_file, j))
+
+                ngrams = text_ngrams(normalized, n)
+                ngrams_count.append(len(ngrams))
+                for ngram in ngrams:
+                    postings.setdefault(ngram, []).append(position)
+
+        self.postings: dict[str, np.ndarray] = {ngram: np.array(ids, dtype=np.int32) for ngram, ids in postings.items()}
+        self.ngrams_count = np.array(ngrams_count, dtype=np.float64)
+
+        logger.info(f"n-gram index built: {len(self.positions)} events, {len(self.postings)} {n}-grams")
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def candidates(self, normalized: str, top_k: int) -> List[Tuple[SubFile, int]]:
+        """Return the top_k events closest to the normalized text, in index (episode then event) order
+
+        Args:
+            normalized (str): normalized text of the film line
+            top_k (int): maximum number of candidates
+
+        Returns:
+            List[Tuple[SubFile, int]]: (episode, event index) pairs to compare with srt_similarity
+        """
+        ngrams = text_ngrams(normalized, self.n)
+        matched = [self.postings[ngram] for ngram in ngrams if ngram in self.postings]
+        if not matched:
+            return []
+
+        shared = np.bincount(np.concatenate(matched), minlength=len(self.positions))
+        # dice coefficient on the n-gram sets, rank events like quick_ratio would
+        scores = 2 * shared / (len(ngrams) + self.ngrams_count)
+
+        hits = np.flatnonzero(shared)
+        if len(hits) > top_k:
+            hits = hits[np.argpartition(scores[hits], -top_k)[-top_k:]]
+        # keep the scan order so the first acceptable match wins like in the exhaustive search
+        hits.sort()
+
+        return [self.positions[position] for position in hits]
@@ -0,0 +1,77 @@
+import logging
+import numpy as np
+from typing import List, Sequence
+
+from src.interface import SubFile
+
+logger = logging.getLogger(__name__)
+
+
+class QuickRatioEngine:
+    """Vectorized SequenceMatcher.quick_ratio over the normalized French events
+
+    quick_ratio only counts the characters two texts have in common, so every event is
+    encoded once as a character count vector (one column per character of the corpus)
+    and a film line is compared with a whole episode in one matrix operation.
+    The scores are exactly the ones of TimecodesFinder.normalized_similarity
+    """
+
+    def __init__(self, sub_files: List[SubFile]) -> None:
+        characters = sorted({c for sub_file in sub_files for text in sub_file.normalized_texts for c in text})
+        self.alphabet: dict[str, int] = {c: k for k, c in enumerate(characters)}
+
+        # rows of every episode are stored one after the other in the corpus matrix
+        self.offsets: dict[str, int] = {}
+        texts: List[str] = []
+        for sub_file in sub_files:
+            self.offsets[sub_file.path] = len(texts)
+            texts.extend(sub_file.normalized_texts)
+
+        self.lengths = np.array([len(text) for text in texts], dtype=np.int64)
+        self.counts = np.zeros((len(texts), len(self.alphabet)), dtype=np.uint16)
+
+        rows = np.repeat(np.arange(len(texts)), self.lengths)
+        columns = np.array([self.alphabet[c] for text in texts for c in text], dtype=np.int64)
+        np.add.at(self.counts, (rows, columns), 1)
+
+        logger.info(f"quick_ratio engine built: {len(texts)} events, {len(self.alphabet)} characters")
+
+    def encode(self, normalized: str) -> np.ndarray:
+        """Character count vector of a normalized text, characters absent from the corpus can't match"""
+        counts = np.zeros(len(self.alphabet), dtype=np.uint16)
+        for c in normalized:
+            column = self.alphabet.get(c)
+            if column is not None:
+                counts[column] += 1
+        return counts
+
+    def similarities(self, film_counts: np.ndarray, film_length: int, sub_file: SubFile, indexes: Sequence[int]) -> np.ndarray:
+        """quick_ratio of an encoded film line against some events of an episode
+
+        Args:
+            film_counts (np.ndarray): film line encoded with encode
+            film_length (int): length of the normalized film line
+            sub_file (SubFile): episode of the events
+            indexes (Sequence[int]): indexes of the events in the episode
+
+        Returns:
+            np.ndarray: one score per index, same values as normalized_similarity
+        """
+        offset = self.offsets[sub_file.path]
+        if isinstance(indexes, range) and indexes.step == 1:
+            rows = slice(offset + indexes.start, offset + indexes.stop)
+        else:
+            rows = offset + np.asarray(indexes, dtype=np.int64)
+
+        matches = np.minimum(self.counts[rows], film_counts).sum(axis=1, dtype=np.int64)
+        total = film_length + self.lengths[rows]
+
+        # same formula as difflib: 2.0 * matches / length, 1.0 when both texts are empty
+        return np.divide(2.0 * matches, total, out=np.ones(len(total)), where=total > 0)
+
+    def corpus_similarities(self, normalized: str) -> np.ndarray:
+        """quick_ratio of a normalized film line against every event of the corpus, in offsets order"""
+        film_counts = self.encode(normalized)
+        matches = np.minimum(self.counts, film_counts).sum(axis=1, dtype=np.int64)
+        total = len(normalized) + self.lengths
+        return np.divide(2.0 * matches, total, out=np.ones(len(total)), where=total > 0)
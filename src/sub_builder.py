@@ -1,61 +1,133 @@
 import pysubs2, os, logging
-from typing import List
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from itertools import accumulate
+from typing import List, Iterable, NamedTuple, Optional, Tuple
 from src.helpers import shift
-from copy import deepcopy
 from tqdm import tqdm
 
-from src.interface import Config, Timecode, SubFile, Time, FilmInfos
-from src.sub_files_loader import load_sub_files
+from src.interface import Config, Timecode, SubFile, CompactEvent, Time, FilmInfos
+from src.sub_files_loader import load_sub_files, episode_cache, loading_workers
+from src.instrumentation import Instrumentation, NULL_INSTRUMENTATION
+from src.ass_writer import write_ass
 
 logger = logging.getLogger(__name__)
 
+
+class EpisodeEvents:
+    """Events of a to-build episode in file order, with the running maximum of their ends
+
+    The running maximum is sorted, so the events of a timecode window are found by bisection
+    even when the events of the file are not in order
+    """
+
+    def __init__(self, sub_file: SubFile) -> None:
+        self.sub_file = sub_file
+        self.events: List[CompactEvent] = sub_file.events
+        self.max_ends: List[int] = list(accumulate((event.end for event in self.events), max))
+
+    def window(self, start: int, end: int) -> Tuple[List[CompactEvent], Optional[CompactEvent]]:
+        """Events of the window, same rules as reading the file until the first event ending after end
+
+        Returns:
+            Tuple[List[CompactEvent], Optional[CompactEvent]]: events ending inside the window, in
+            file order, and the first event ending after the window if it starts before its end
+        """
+        # every event before first ends before start, last is the first event ending after end
+        first = bisect_left(self.max_ends, start)
+        last = bisect_right(self.max_ends, end)
+
+        inside = [event for event in self.events[first:last] if event.end >= start]
+        crossing = self.events[last] if last < len(self.events) and self.events[last].start < end else None
+        return inside, crossing
+
+
+class PlanStep(NamedTuple):
+    """A timecode reduced to what the building of any language needs"""
+    episode_number: int
+    start: int
+    end: int
+    shift: int
+
+
+def plan_step(timecode: Timecode) -> PlanStep:
+    logger.info(f"timecode {timecode.episode_number} {timecode.sub_file_name}: {Time(timecode.start)} - {Time(timecode.end)} : shift {timecode.shift.time}")
+    return PlanStep(timecode.episode_number, timecode.start, timecode.end, timecode.shift.time)
+
+
+def build_plan(timecodes: Iterable[Timecode]) -> List[PlanStep]:
+    """Build plan of a film: computed once from its timecodes, then applied to the subs of every language"""
+    return [plan_step(timecode) for timecode in timecodes]
+
+
 class SubBuilder:
-    def __init__(self, config: Config, current_to_build_path: str, film_file_name: str, timecodes: list[Timecode]) -> None:
+    def __init__(self, config: Config, current_to_build_path: str, film_file_name: str, timecodes: list[Timecode], instrumentation: Instrumentation = NULL_INSTRUMENTATION) -> None:
         self.config = config
         self.current_to_build_path = current_to_build_path
         self.film_file_name = film_file_name
         self.toBuild_subs: list[SubFile] = []
         self.timecodes = timecodes
+        self.instrumentation = instrumentation
+        self.phase_prefix = f"build/{os.path.basename(current_to_build_path)}"
         
         film_infos: FilmInfos = config.get_film_info(film_file_name)
 
-        self.toBuild_subs: List[SubFile] = load_sub_files(current_to_build_path, film_infos.covered_episodes, to_build=True)
+        with self.instrumentation.phase(f"{self.phase_prefix}/load"):
+            self.toBuild_subs: List[SubFile] = load_sub_files(current_to_build_path, film_infos.covered_episodes, to_build=True, cache=episode_cache(config), workers=loading_workers(config))
+
+        # first file of each episode number, like the search in the files list it replaces
+        self.episodes: dict[int, EpisodeEvents] = {}
+        for sub_file in self.toBuild_subs:
+            if sub_file.episode_number not in self.episodes:
+                self.episodes[sub_file.episode_number] = EpisodeEvents(sub_file)
+
+    def build_subs(self, progressbarPosition: int, plan: Iterable[PlanStep] = None) -> None:
+        """Build and save the sub of the film
 
-    def build_subs(self, progressbarPosition: int) -> None:
+        Args:
+            progressbarPosition (int): position of the progress bar
+            plan (Iterable[PlanStep], optional): build plan shared by the languages, consumed as it comes when the timecodes are still being found. Defaults to the plan of self.timecodes.
+        """
         printName = self.film_file_name[0:(len(self.film_file_name)//2)]
 
+        if plan is None:
+            plan = build_plan(self.timecodes)
+
+        # info and styles of the result, its events stay CompactEvent up to write_ass
         result_ass = pysubs2.SSAFile()
 
         logger.info(f"loaded subs files : {len(self.toBuild_subs)}")
 
-        progressBar = tqdm(total=len(self.timecodes), desc=f"Build sub {printName}", unit="timecode", position=progressbarPosition, leave=False)
+        progressBar = tqdm(total=len(plan) if isinstance(plan, list) else None, desc=f"Build sub {printName}", unit="timecode", position=progressbarPosition, leave=False)
 
-        for timecode in self.timecodes:
-            currentSub_file = deepcopy(next((s for s in self.toBuild_subs if s.episode_number == timecode.episode_number), None))
-            
-            if currentSub_file is None:
-                logger.rich(f"[red]No subtitle file found for episode {timecode.episode_number}[/]", logging.ERROR)
+        with self.instrumentation.phase(f"{self.phase_prefix}/slice"):
+            for step in plan:
+                # the episode is only read, the events kept are copied one by one
+                episode = self.episodes.get(step.episode_number)
             
-            logger.info(f"timecode {timecode.episode_number} {timecode.sub_file_name}: {Time(timecode.start)} - {Time(timecode.end)} : shift {timecode.shift.time}")
-
-            for sub in currentSub_file.pysub_file:
-                if sub.end > timecode.end:
-                    if sub.start < timecode.end:
-                        sub.end = timecode.end
-                        sub = shift(sub, timecode.shift.time)
-                        result_ass.append(sub)
-                        progressBar.update(1)
-                    break
-                
-                if sub.end >= timecode.start:
-                    if sub.start < timecode.start:
-                        sub.start = timecode.start
-                    sub = shift(sub, timecode.shift.time)
-                    result_ass.append(sub)
+                if episode is None:
+                    logger.rich(f"[red]No subtitle file found for episode {step.episode_number}[/]", logging.ERROR)
+
+                inside, crossing = episode.window(step.start, step.end)
+                for event in inside:
+                    sub = event.copy()
+                    if sub.start < step.start:
+                        sub.start = step.start
+                    sub = shift(sub, step.shift)
+                    result_ass.events.append(sub)
+                    progressBar.update(1)
+
+                if crossing is not None:
+                    sub = crossing.copy()
+                    sub.end = step.end
+                    sub = shift(sub, step.shift)
+                    result_ass.events.append(sub)
                     progressBar.update(1)
 
-        self.remove_duplicate(result_ass)
-        result_ass.events.sort(key=lambda e: e.start)
+        with self.instrumentation.phase(f"{self.phase_prefix}/dedup"):
+            self.remove_duplicate(result_ass)
+            result_ass.events.sort(key=lambda e: e.start)
+        self.instrumentation.count(f"{self.phase_prefix}/events", len(result_ass.events))
 
         ep_sub = self.toBuild_subs.pop().pysub_file
 
@@ -83,10 +155,10 @@ class SubBuilder:
         except:
             pass
         
-        remove_unused_styles(result_ass)
-
-        logger.info(f"Result file saved: {full_save_path}")
-        result_ass.save(full_save_path, overwrite=True, encoding='utf-8')
+        with self.instrumentation.phase(f"{self.phase_prefix}/save"):
+            # the styles of the episodes are only read, the unused ones are not written
+            logger.info(f"Result file saved: {full_save_path}")
+            write_ass(full_save_path, result_ass.info, used_styles(result_ass), result_ass.events)
 
 
     def remove_duplicate(self, subs: pysubs2.SSAFile):
@@ -118,12 +190,22 @@ class SubBuilder:
                 sub_to_remove.append(current)
                 continue
         
-        sub_to_remove = sorted(sub_to_remove, reverse=True)
+        # same order as sorting the events, they compare on their times
+        sub_to_remove.sort(key=lambda e: (e.start, e.end), reverse=True)
 
+        # events compare on their times, so each removal takes out the first event left with the same times
+        to_remove = Counter((sub.start, sub.end) for sub in sub_to_remove)
         for sub in sub_to_remove:
             logger.info(f"Duplicate removed: {sub.text} {Time(sub.start)}")
-            if sub in subs.events:
-                subs.events.remove(sub)
+
+        kept: list[pysubs2.SSAEvent] = []
+        for event in subs.events:
+            times = (event.start, event.end)
+            if to_remove[times] > 0:
+                to_remove[times] -= 1
+            else:
+                kept.append(event)
+        subs.events[:] = kept
 
 
     def default_1080_style(self, subs: pysubs2.SSAFile):
@@ -140,21 +222,7 @@ class SubBuilder:
             subs.styles[style].marginr = 70
             subs.styles[style].marginb = 70
 
-def remove_unused_styles(subs: pysubs2.SSAFile):
-    used_styles = set()
-    for event in subs.events:
-        used_styles.add(event.style)
-
-    unused_styles = set(subs.styles.keys()) - used_styles
-
-    for style in unused_styles:
-        del subs.styles[style]
-                        
-
-
-
-               
-
-            
-
-
+def used_styles(subs: pysubs2.SSAFile) -> dict[str, pysubs2.SSAStyle]:
+    """Styles of subs used by at least one event, in the same order"""
+    used = {event.style for event in subs.events}
+    return {name: style for name, style in subs.styles.items() if name in used}
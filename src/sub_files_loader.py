@@ -1,50 +1,78 @@
-import os, logging, pysubs2
-from typing import List
+import io, os, logging, threading, multiprocessing.util, pysubs2
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional
 
-from src.interface import SubFile
+from src.interface import Config, SubFile
 from src.helpers import extract_first_number
+from src.ass_reader import parse_ass
+from src.workers import spawn_pool
 
 logger = logging.getLogger(__name__)
 
 
-def is_style_equal(style1: pysubs2.SSAStyle, style2: pysubs2.SSAStyle):
-    return style1.fontname == style2.fontname and style1.fontsize == style2.fontsize and style1.primarycolor == style2.primarycolor and style1.secondarycolor == style2.secondarycolor and style1.tertiarycolor == style2.tertiarycolor and style1.outlinecolor == style2.outlinecolor and style1.backcolor == style2.backcolor and style1.bold == style2.bold and style1.italic == style2.italic and style1.underline == style2.underline and style1.strikeout == style2.strikeout and style1.scalex == style2.scalex and style1.scaley == style2.scaley and style1.spacing == style2.spacing and style1.angle == style2.angle and style1.borderstyle == style2.borderstyle and style1.outline == style2.outline and style1.shadow == style2.shadow and style1.alignment == style2.alignment and style1.marginl == style2.marginl and style1.marginr == style2.marginr and style1.marginv == style2.marginv and style1.alphalevel == style2.alphalevel
+# parameters compared by is_style_equal, every style field but its name
+STYLE_FIELDS = ("fontname", "fontsize", "primarycolor", "secondarycolor", "tertiarycolor", "outlinecolor", "backcolor",
+                "bold", "italic", "underline", "strikeout", "scalex", "scaley", "spacing", "angle", "borderstyle",
+                "outline", "shadow", "alignment", "marginl", "marginr", "marginv", "alphalevel")
 
 
-def is_in_styles(styleName, styleParams: pysubs2.SSAStyle, styles: dict[str, pysubs2.SSAStyle]):
-    for style in styles:
-        if style == styleName:
-            # if styles[style] == styleParams:
-            if is_style_equal(styles[style], styleParams):
-                # print(styleName + ' ' + str(styles[style]) + ' ' + str(styleParams))
-                return (True, True)
-            else:
-                return (True, False)
-        
-    return (False, False)
+def style_key(style: pysubs2.SSAStyle) -> tuple:
+    """Canonical, hashable parameters of a style: two styles are equal when their keys are"""
+    return tuple(getattr(style, field) for field in STYLE_FIELDS)
+
+
+def is_style_equal(style1: pysubs2.SSAStyle, style2: pysubs2.SSAStyle):
+    return style_key(style1) == style_key(style2)
 
 
-def create_style_list(sub_files: List[SubFile]) -> dict[str, pysubs2.SSAStyle]:
+def create_style_list(sub_files: List[SubFile], shared_events=False) -> dict[str, pysubs2.SSAStyle]:
     styles: dict[str, pysubs2.SSAStyle] = {}
+    # key of every style of the list, computed once
+    keys: dict[str, tuple] = {}
 
     for file in sub_files:
-        to_modify: list[list[str]] = []
-        
+        renames: dict[str, str] = {}
+
         subs = file.pysub_file
-        for style in subs.styles:
-            same_name, same_params = is_in_styles(style, subs.styles[style], styles)
-            if same_name:
-                if not same_params:
-                    to_modify.append([style, file.basename[:-4] + '_' + style])
-                    styles[file.basename[:-4] + '_' + style] = subs.styles[style]
+        for style, params in subs.styles.items():
+            key = style_key(params)
+            if style in keys:
+                if keys[style] != key:
+                    new_name = file.basename[:-4] + '_' + style
+                    renames[style] = new_name
+                    styles[new_name] = params
+                    keys[new_name] = key
             else:
-                styles[style] = subs.styles[style]
+                styles[style] = params
+                keys[style] = key
 
-        for names in to_modify:
-            subs.rename_style(names[0], names[1])
+        if renames:
+            rename_styles(file, renames, shared_events)
 
     return styles
-    
+
+
+def rename_styles(file: SubFile, renames: dict[str, str], shared_events=False):
+    """SSAFile.rename_style of every style of renames, with one pass over the events
+
+    With shared_events (loaded from the episode cache) the events of the renamed styles are replaced by renamed copies
+    """
+    styles = file.pysub_file.styles
+    for old_name, new_name in renames.items():
+        if new_name in styles:
+            raise ValueError(f"There is already a style called {new_name!r}")
+        styles[new_name] = styles.pop(old_name)
+
+    for k, event in enumerate(file.events):
+        new_name = renames.get(event.style)
+        if new_name is not None:
+            if shared_events:
+                event = event.copy()
+                file.events[k] = event
+            event.style = new_name
+
 
 def addStyleInAllFiles(styles: dict[str, pysubs2.SSAStyle], sub_files: List[SubFile]):
     for f in sub_files:
@@ -52,13 +80,14 @@ def addStyleInAllFiles(styles: dict[str, pysubs2.SSAStyle], sub_files: List[SubF
 
 
 
-def styles_in_sub(sub_files: List[SubFile]):
-    styles = create_style_list(sub_files)
+def styles_in_sub(sub_files: List[SubFile], shared_events=False):
+    styles = create_style_list(sub_files, shared_events)
     addStyleInAllFiles(styles, sub_files)
 
 
-def load_sub_files(path: str, covered_episodes: List[int], to_build=False) -> List[SubFile]:
-    sub_files: List[SubFile] = []
+def list_sub_files(path: str, covered_episodes: List[int]) -> List[str]:
+    """Paths of the ass files of the covered episodes by episode number, the order they are loaded in whatever the listdir order"""
+    sub_paths: List[str] = []
 
     for sub_file in os.listdir(path):
         if not sub_file.endswith(".ass"):
@@ -68,14 +97,277 @@ def load_sub_files(path: str, covered_episodes: List[int], to_build=False) -> Li
         if not (extract_first_number(sub_file) in covered_episodes):
             continue
 
-        sub_path = os.path.join(path, sub_file)
+        sub_paths.append(os.path.join(path, sub_file))
+    return sorted(sub_paths, key=lambda sub_path: (extract_first_number(os.path.basename(sub_path)), sub_path))
+
+
+def load_sub_file(sub_path: str, styles=True) -> SubFile:
+    """Episode file read by the ass reader, by pysubs2 when the reader does not handle it
+
+    Without styles the file may come without its styles, enough for the matching
+    """
+    with open(sub_path, encoding="utf-8") as file:
+        return parse_sub_file(sub_path, file.read(), styles)
+
+
+def parse_sub_file(sub_path: str, text: str, styles=True) -> SubFile:
+    sub_file = parse_ass(text, sub_path, styles)
+    if sub_file is None:
+        logger.debug(f"{os.path.basename(sub_path)} loaded with pysubs2")
+        sub_file = SubFile(pysub_file=pysubs2.SSAFile.from_string(text), path=sub_path)
+    return sub_file
+
+
+def read_sub_file(sub_path: str) -> bytes:
+    with open(sub_path, "rb") as file:
+        return file.read()
+
+
+def parse_sub_file_bytes(sub_path: str, data: bytes, styles=True) -> tuple[Optional[SubFile], Optional[tuple[str, str]]]:
+    """load_sub_file of a file read by the parent, in a parsing process
+
+    Returns the episode or the type name and message of the error: some pysubs2 errors can't be unpickled
+    in the parent, sent as they are they would break the whole pool
+    """
+    try:
+        # decoded like open(sub_path, encoding="utf-8") reads it, universal newlines included
+        text = io.TextIOWrapper(io.BytesIO(data), encoding="utf-8").read()
+        return parse_sub_file(sub_path, text, styles), None
+    except Exception as e:
+        return None, (type(e).__name__, str(e))
+
+
+# loaded episode memory, estimated from the measures of the compact events: per event and per character of text
+EVENT_BYTES = 130
+
+
+def file_version(sub_path: str) -> tuple[int, int]:
+    """Modification time and size of the file, they change when the file is edited or replaced"""
+    stat = os.stat(sub_path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class EpisodeCache:
+    """Parsed episode files shared by every film and language of a run, keyed by path and modification time
+
+    Past the memory budget the least recently used files are evicted. The cached files are never handed out:
+    each load gets a new SubFile with its own info, styles and events list, the events themselves are shared
+    and only read (the builders copy the events they keep, styles_in_sub copies the events it renames)
+    """
+
+    def __init__(self, budget: int) -> None:
+        self.budget = budget
+        self.size = 0
+        self.files: OrderedDict[str, tuple[tuple[int, int], SubFile, int]] = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, sub_path: str) -> SubFile:
+        version, view = self.lookup(sub_path)
+        if view is None:
+            view = self.store(sub_path, version, load_sub_file(sub_path))
+        return view
+
+    def lookup(self, sub_path: str) -> tuple[tuple[int, int], Optional[SubFile]]:
+        """Version of the file on disk and a view of its cached episode, None when it has to be loaded"""
+        version = file_version(sub_path)
+
+        with self.lock:
+            entry = self.files.get(sub_path)
+            if entry is not None and entry[0] == version:
+                self.files.move_to_end(sub_path)
+                self.hits += 1
+                return version, episode_view(entry[1])
+            self.misses += 1
+        return version, None
+
+    def store(self, sub_path: str, version: tuple[int, int], sub_file: SubFile) -> SubFile:
+        """Cache a loaded episode under the version looked up before loading it, a view of it"""
+        size = len(sub_file.events) * EVENT_BYTES + sum(len(event.text) for event in sub_file.events)
+
+        with self.lock:
+            # an older version of the file is replaced
+            if sub_path in self.files:
+                self.size -= self.files.pop(sub_path)[2]
+            if size <= self.budget:
+                self.files[sub_path] = (version, sub_file, size)
+                self.size += size
+                while self.size > self.budget:
+                    _, (_, _, evicted_size) = self.files.popitem(last=False)
+                    self.size -= evicted_size
+        return episode_view(sub_file)
+
+
+def episode_view(sub_file: SubFile) -> SubFile:
+    subs = sub_file.pysub_file
+    view = pysubs2.SSAFile()
+    view.styles = {name: style.copy() for name, style in subs.styles.items()}
+    view.info = dict(subs.info)
+    view.aegisub_project = dict(subs.aegisub_project)
+    view.fonts_opaque = dict(subs.fonts_opaque)
+    view.graphics_opaque = dict(subs.graphics_opaque)
+    view.fps = subs.fps
+    view.format = subs.format
+    # the SubFile gets its own list of the shared events
+    return SubFile(pysub_file=view, path=sub_file.path, events=sub_file.events)
+
+
+shared_episode_cache: EpisodeCache = None
+shared_episode_cache_lock = threading.Lock()
+
+
+def episode_cache(config: Config) -> Optional[EpisodeCache]:
+    """Episode cache of the process, None when the config disables it
+
+    The films and languages translated in threads share it, each worker process has its own
+    """
+    global shared_episode_cache
+    if not config.episode_cache:
+        return None
+
+    with shared_episode_cache_lock:
+        if shared_episode_cache is None:
+            shared_episode_cache = EpisodeCache(config.episode_cache_mb * 1024 * 1024)
+        return shared_episode_cache
+
+
+def loading_workers(config: Config) -> int:
+    """Parsing processes of load_sub_files, 0 when the config loads the files one after another"""
+    if not config.parallel_loading:
+        return 0
+    return config.loading_workers if config.loading_workers > 0 else os.cpu_count()
+
+
+# threads reading the files of a parallel load, waiting on the disk or the network share
+READ_THREADS = 16
+
+shared_parse_pool: ProcessPoolExecutor = None
+shared_parse_pool_workers = 0
+shared_parse_pool_lock = threading.Lock()
+
+
+def parse_pool(workers: int) -> ProcessPoolExecutor:
+    """Parsing processes of the parallel loads, spawned once and shared by every load of the process
+
+    The film finders, language builders and LSH index of a run all load episodes, the processes are not
+    spawned again for each of them. Shut down by shutdown_parse_pool at the end of the run
+    """
+    global shared_parse_pool, shared_parse_pool_workers
+    with shared_parse_pool_lock:
+        if shared_parse_pool is None or shared_parse_pool_workers != workers:
+            if shared_parse_pool is not None:
+                shared_parse_pool.shutdown(wait=False)
+            shared_parse_pool = spawn_pool(workers)
+            shared_parse_pool_workers = workers
+        return shared_parse_pool
+
+
+def discard_parse_pool(pool: ProcessPoolExecutor) -> None:
+    """A parsing process died, the next load gets a new pool"""
+    global shared_parse_pool
+    with shared_parse_pool_lock:
+        if shared_parse_pool is pool:
+            shared_parse_pool = None
+    pool.shutdown(wait=False)
+
+
+def shutdown_parse_pool() -> None:
+    global shared_parse_pool
+    with shared_parse_pool_lock:
+        pool, shared_parse_pool = shared_parse_pool, None
+    if pool is not None:
+        pool.shutdown()
+
+
+# a worker process joins its children before exiting: the pool of a film worker is shut down first
+multiprocessing.util.Finalize(None, shutdown_parse_pool, exitpriority=10)
+
+
+def load_parallel(sub_paths: List[str], styles: bool, cache: Optional[EpisodeCache], workers: int) -> List[SubFile | Exception]:
+    """Episode of every path or the error loading it, in the same order: read by a thread pool, parsed by the parse pool
+
+    Each file is handed to the parsing processes as soon as it is read, the cached episodes are not read again
+    """
+    loaded: List[SubFile | Exception] = [None] * len(sub_paths)
+    versions: dict[int, tuple[int, int]] = {}
+    to_load: List[int] = []
+
+    for k, sub_path in enumerate(sub_paths):
+        if cache is None:
+            to_load.append(k)
+            continue
+        try:
+            versions[k], loaded[k] = cache.lookup(sub_path)
+        except Exception as e:
+            loaded[k] = e
+        if loaded[k] is None:
+            to_load.append(k)
+
+    if not to_load:
+        return loaded
+
+    parses: dict[int, Future] = {}
+    parsers = parse_pool(workers)
+    broken = False
+    with ThreadPoolExecutor(max_workers=min(READ_THREADS, len(to_load))) as readers:
+        reads = {readers.submit(read_sub_file, sub_paths[k]): k for k in to_load}
+        for read in as_completed(reads):
+            k = reads[read]
+            if read.exception() is not None:
+                loaded[k] = read.exception()
+                continue
+            try:
+                parses[k] = parsers.submit(parse_sub_file_bytes, sub_paths[k], read.result(), styles)
+            except BrokenProcessPool:
+                broken = True
+
+    # stored in the order of the paths, the cache evicts the same episodes whatever the parsing order
+    for k in to_load:
+        if isinstance(loaded[k], Exception):
+            continue
         try:
-            sub = pysubs2.load(sub_path, encoding="utf-8")
-            sub_files.append(SubFile(pysub_file=sub, path=sub_path))
+            if k in parses and not isinstance(parses[k].exception(), BrokenProcessPool):
+                sub_file, error = parses[k].result()
+                if error is not None:
+                    raise ValueError(f"{error[0]}: {error[1]}")
+            else:
+                # a parsing process died, the paths left are loaded here
+                broken = True
+                sub_file = load_sub_file(sub_paths[k], styles)
+        except Exception as e:
+            loaded[k] = e
+            continue
+        loaded[k] = cache.store(sub_paths[k], versions[k], sub_file) if cache is not None else sub_file
+
+    if broken:
+        discard_parse_pool(parsers)
+    return loaded
+
+
+def load_sub_files(path: str, covered_episodes: List[int], to_build=False, cache: EpisodeCache = None, workers=0) -> List[SubFile]:
+    """Episodes of the covered episodes by episode number, in the order of list_sub_files
+
+    With workers the files are loaded concurrently, see load_parallel. Without a cache only the built episodes get their styles
+    """
+    sub_files: List[SubFile] = []
+    sub_paths = list_sub_files(path, covered_episodes)
+    loaded = load_parallel(sub_paths, to_build or cache is not None, cache, workers) if workers else None
+
+    for k, sub_path in enumerate(sub_paths):
+        try:
+            if loaded is not None:
+                if isinstance(loaded[k], Exception):
+                    raise loaded[k]
+                sub_files.append(loaded[k])
+            elif cache is not None:
+                sub_files.append(cache.load(sub_path))
+            else:
+                sub_files.append(load_sub_file(sub_path, styles=to_build))
             logger.info(f"[green]Subtitle file loaded successfully: {os.path.basename(sub_path)}[/]")
         except Exception as e:
             logger.warning(f"[red]Error loading subtitle file {sub_path}: {e}[/]")
 
     if to_build:
-        styles_in_sub(sub_files)
-    return sub_files
\ No newline at end of file
+        styles_in_sub(sub_files, shared_events=cache is not None)
+    return sub_files
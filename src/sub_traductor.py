@@ -1,24 +1,54 @@
-import os, sys, logging
-from typing import List
+import os, sys, logging, threading
+from queue import Queue
+from typing import Iterator, List, Tuple
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from src.interface import Config, Timecode, Time, Stats, Cut
 from src.timecode_finder import TimecodesFinder
-from src.sub_builder import SubBuilder
+from src.timecode_cache import TimecodesCache
+from src.sub_builder import SubBuilder, PlanStep, plan_step, build_plan
+from src.instrumentation import Instrumentation, create_instrumentation, save_instrumentation_report
+from src.sub_files_loader import shutdown_parse_pool
+from src.workers import spawn_pool, init_worker_logs, take_worker_records, replay_records
 from src.constants import MS_TEN_S
 
 logger = logging.getLogger(__name__) 
 
+
+# set once per worker process by init_process_worker, tasks only send the film name
+worker_config: Config = None
+# set once per worker process by init_build_worker, tasks only send the language folder
+worker_plan: List[PlanStep] = None
+
 def process(config: Config, film_sub_name: str, position: int, is_thread=True) -> Stats:
     if is_thread:
-        logger = logging.getLogger()
-        logger.setLevel(logging.CRITICAL)
+        root_logger = logging.getLogger()
+        root_logger.setLevel(logging.CRITICAL)
         def log_rich(message, level=logging.INFO):
             pass
-        logger.rich = log_rich
+        root_logger.rich = log_rich
+    instrumentation = create_instrumentation(config)
     try:
-        finder: TimecodesFinder = TimecodesFinder(config, film_sub_name)
-        timecodes, stats = finder.find_timecodes(position)
+        with instrumentation.phase("cache/load"):
+            cache = TimecodesCache(config, film_sub_name) if config.timecodes_cache else None
+            cached = cache.load() if cache is not None else None
+
+        built = False
+        if cached is not None:
+            timecodes, stats = cached
+        else:
+            with instrumentation.phase("match/load"):
+                finder: TimecodesFinder = TimecodesFinder(config, film_sub_name, instrumentation)
+            if config.stream_build and os.path.exists(config.subs_to_translate_path):
+                with instrumentation.phase("match/search"):
+                    timecodes, stats = stream_build(config, finder, position, instrumentation)
+                built = True
+            else:
+                with instrumentation.phase("match/search"):
+                    timecodes, stats = finder.find_timecodes(position)
+            if cache is not None:
+                with instrumentation.phase("cache/save"):
+                    cache.save(timecodes, stats)
     except FileNotFoundError as e:
         logger.warning(e)
         return Stats(str(config.get_film_info(film_sub_name).number), -1)
@@ -31,24 +61,177 @@ def process(config: Config, film_sub_name: str, position: int, is_thread=True) -
         logger.rich(f"[red][bold]subs-to-translate-path ({config.subs_to_translate_path})[/bold] is not a valid path[/red]")
         return
 
+    if not built:
+        build_languages(config, film_sub_name, timecodes, position, instrumentation)
+
+    stats.instrumentation = instrumentation.report()
+    return stats
+
+
+def to_build_paths(config: Config) -> List[str]:
+    """Folders of the subs to translate, one per language, or the folder itself when it holds the ass files"""
+    paths: List[str] = []
     for lg_sub_toBuild in os.listdir(config.subs_to_translate_path):
         current_to_build_path = os.path.join(config.subs_to_translate_path, lg_sub_toBuild)
         
         if os.path.isdir(current_to_build_path):
-            builder = SubBuilder(config, current_to_build_path, film_sub_name, timecodes)
-            builder.build_subs(position)
+            paths.append(current_to_build_path)
         
         if lg_sub_toBuild.endswith(".ass"):
-            current_to_build_path = config.subs_to_translate_path
-            builder = SubBuilder(config, current_to_build_path, film_sub_name, timecodes)
-            builder.build_subs(position)
+            paths.append(config.subs_to_translate_path)
             break
-    return stats
+    return paths
+
+
+def build_languages(config: Config, film_sub_name: str, timecodes: List[Timecode], position: int, instrumentation: Instrumentation) -> None:
+    """Build the sub of the film in every language, the build plan is computed once and applied to all of them"""
+    with instrumentation.phase("build/plan"):
+        plan: List[PlanStep] = build_plan(timecodes)
+    paths = to_build_paths(config)
+
+    def build(path: str):
+        SubBuilder(config, path, film_sub_name, timecodes, instrumentation).build_subs(position, plan)
+
+    if config.build_mode == "thread" and len(paths) > 1:
+        with ThreadPoolExecutor(max_workers=config.build_workers if config.build_workers > 0 else len(paths)) as executor:
+            # in languages order, the first error is raised once every language is done
+            for future in [executor.submit(build, path) for path in paths]:
+                future.result()
+    elif config.build_mode == "process" and len(paths) > 1:
+        workers = config.build_workers if config.build_workers > 0 else min(len(paths), os.cpu_count())
+        # the plan is sent once per worker as plain tuples, with the config
+        compact_plan = [tuple(step) for step in plan]
+        with spawn_pool(workers, init_build_worker, (config, compact_plan)) as executor:
+            for future in [executor.submit(build_in_worker, path, film_sub_name, position) for path in paths]:
+                report, records = future.result()
+                replay_records(records)
+                instrumentation.merge(report)
+    else:
+        for path in paths:
+            build(path)
+
+
+# sent to the streamed builders instead of the end of the plan when the matching fails
+ABORT_BUILD = object()
+
+
+def stream_build(config: Config, finder: TimecodesFinder, position: int, instrumentation: Instrumentation) -> Tuple[List[Timecode], Stats]:
+    """Find the timecodes of the film while the subs of every language are built from them
+
+    Each builder consumes the build plan from its queue in a thread, a step as soon as the run of its
+    timecode is closed, the outputs are the same as building from the full list.
+    """
+    builders = [SubBuilder(config, path, finder.film_sub_name, [], instrumentation) for path in to_build_paths(config)]
+    queues: List[Queue] = [Queue() for _ in builders]
+    errors: List[Exception] = []
+
+    def plan(queue: Queue) -> Iterator[PlanStep]:
+        for step in iter(queue.get, None):
+            if step is ABORT_BUILD:
+                # raised inside build_subs, before anything is written
+                raise RuntimeError("matching of the film failed, build aborted")
+            yield step
+
+    def build(builder: SubBuilder, queue: Queue):
+        try:
+            builder.build_subs(position, plan(queue))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=build, args=(builder, queue), daemon=True) for builder, queue in zip(builders, queues)]
+    for thread in threads:
+        thread.start()
+
+    timecodes: List[Timecode] = []
+    try:
+        stream, stats = finder.stream_timecodes(position)
+        for timecode in stream:
+            timecodes.append(timecode)
+            step = plan_step(timecode)
+            for queue in queues:
+                queue.put(step)
+    except BaseException:
+        # the builders stop without saving a partial sub, the error of the matching is raised
+        for queue in queues:
+            queue.put(ABORT_BUILD)
+        raise
+    else:
+        for queue in queues:
+            queue.put(None)
+    finally:
+        for thread in threads:
+            thread.join()
+
+    if errors:
+        raise errors[0]
+    return timecodes, stats
+
+
+def init_process_worker(config: Config):
+    global worker_config
+    worker_config = config
+    init_worker_logs()
+
+
+def init_build_worker(config: Config, compact_plan: List[tuple]):
+    global worker_plan
+    init_process_worker(config)
+    worker_plan = [PlanStep._make(step) for step in compact_plan]
+
+
+def build_in_worker(current_to_build_path: str, film_sub_name: str, position: int) -> tuple[dict, list[logging.LogRecord]]:
+    take_worker_records()
+    instrumentation = create_instrumentation(worker_config)
+    builder = SubBuilder(worker_config, current_to_build_path, film_sub_name, [], instrumentation)
+    builder.build_subs(position, worker_plan)
+    return instrumentation.report(), take_worker_records()
+
+
+def process_in_worker(film_sub_name: str, position: int) -> tuple[Stats, list[logging.LogRecord]]:
+    take_worker_records()
+    stats = process(worker_config, film_sub_name, position, is_thread=False)
+    return stats, take_worker_records()
+
+
+def translate_subs_multiprocess(config: Config):
+    workers = config.workers if config.workers > 0 else os.cpu_count()
+
+    # films are loaded from their paths in the workers, only the config is sent once per worker
+    with spawn_pool(workers, init_process_worker, (config,)) as executor:
+        futures = []
+        results: list[Stats] = []
+        position = 0
+        for film_sub_name in os.listdir(config.films_path):
+            if not film_sub_name.endswith(".ass") or not config.is_to_build(film_sub_name):
+                continue
+
+            futures.append(executor.submit(process_in_worker, film_sub_name, position))
+            position += 1
+
+        for future in as_completed(futures):
+            try:
+                stats, records = future.result()
+            except Exception as e:
+                logger.error(f"Task generated an exception: {e}")
+                continue
+
+            replay_records(records)
+            # a film that failed is logged by its worker and has no stats
+            if stats is not None:
+                results.append(stats)
+
+        Stats.print_stats(results)
+        save_instrumentation_report(config, results)
+        shutdown_parse_pool()
 
 
 def translate_subs_treaded(config: Config):
+    if config.parallel_mode == "process":
+        translate_subs_multiprocess(config)
+        return
+
     # avoid logs in multithread
-    with ThreadPoolExecutor() as executor:
+    with ThreadPoolExecutor(max_workers=config.workers if config.workers > 0 else None) as executor:
         futures = []
         results: list[Stats] = []
         position = 0
@@ -66,6 +249,8 @@ def translate_subs_treaded(config: Config):
                 print(f"Task generated an exception: {e}")
 
         Stats.print_stats(results)
+        save_instrumentation_report(config, results)
+        shutdown_parse_pool()
 
 def translate_subs_single_thread(config: Config):
     position = 0
@@ -78,6 +263,8 @@ def translate_subs_single_thread(config: Config):
         results.append(stats)
     
     Stats.print_stats(results)
+    save_instrumentation_report(config, results)
+    shutdown_parse_pool()
 
 
 def print_cut_timecodes(config: Config, film_name: str):
@@ -0,0 +1,82 @@
+import os, json, hashlib, logging
+from typing import List, Optional, Tuple
+
+from src.interface import Config, Timecode, Stats, SearchStats
+from src.sub_files_loader import list_sub_files
+from src.timecode_finder import ALGORITHM_VERSION, AVG_SIM, REQ_SIM, NOTFOUND_SIM, SINGLE_SIM, COMBINE_SIM, TEST_COMBINE_REQ
+
+logger = logging.getLogger(__name__)
+
+# matching options that change how fast the timecodes are found, not which ones
+SPEED_ONLY_OPTIONS = {"similarity_backend", "film_chunks"}
+
+
+class TimecodesCache:
+    """Timecodes and stats of a film saved on disk
+
+    The key is the hash of everything the timecodes depend on: the film subs, the covered french
+    subs (in loading order), the thresholds, the matching options and ALGORITHM_VERSION
+    """
+
+    def __init__(self, config: Config, film_sub_name: str) -> None:
+        self.config = config
+        self.film_sub_name = film_sub_name
+        self.key = self.compute_key()
+        self.path = os.path.join(config.cache_path, f"{self.key}.json")
+
+    def compute_key(self) -> str:
+        film_infos = self.config.get_film_info(self.film_sub_name)
+        digest = hashlib.sha256()
+
+        parameters = {
+            "version": ALGORITHM_VERSION,
+            "thresholds": [AVG_SIM, REQ_SIM, NOTFOUND_SIM, SINGLE_SIM, COMBINE_SIM, TEST_COMBINE_REQ],
+            "matching": self.config.matching.model_dump(exclude=SPEED_ONLY_OPTIONS),
+            "film-number": film_infos.number,
+        }
+        digest.update(json.dumps(parameters, sort_keys=True).encode("utf-8"))
+
+        for path in [os.path.join(self.config.films_path, self.film_sub_name)] + list_sub_files(self.config.fr_subs_path, film_infos.covered_episodes):
+            digest.update(os.path.basename(path).encode("utf-8"))
+            with open(path, "rb") as file:
+                digest.update(hashlib.sha256(file.read()).digest())
+
+        return digest.hexdigest()
+
+    def load(self) -> Optional[Tuple[List[Timecode], Stats]]:
+        if not os.path.exists(self.path):
+            return None
+
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                data = json.load(file)
+
+            timecodes = [Timecode(start=t["start"], end=t["end"], ms_shift=t["shift"], sub_file_name=t["sub_file_name"]) for t in data["timecodes"]]
+
+            stats = Stats(data["stats"]["film"], data["stats"]["total_to_find"])
+            stats.found = data["stats"]["found"]
+            stats.not_found = data["stats"]["not_found"]
+            stats.subs_not_found = data["stats"]["subs_not_found"]
+            stats.search = SearchStats(**data["stats"]["search"])
+        except Exception as e:
+            logger.warning(f"Invalid timecodes cache {self.path}: {e}")
+            return None
+
+        logger.info(f"Timecodes of {self.film_sub_name} loaded from cache {self.path}")
+        return timecodes, stats
+
+    def save(self, timecodes: List[Timecode], stats: Stats) -> None:
+        data = {
+            "film": self.film_sub_name,
+            "timecodes": [{"start": t.start, "end": t.end, "shift": t.shift.time, "sub_file_name": t.sub_file_name} for t in timecodes],
+            "stats": stats.model_dump(exclude={"instrumentation"}),
+        }
+
+        os.makedirs(self.config.cache_path, exist_ok=True)
+        # write then rename so a film translated in another process never reads half a file
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(data, file, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+        logger.info(f"Timecodes of {self.film_sub_name} saved in cache {self.path}")
@@ -1,13 +1,19 @@
 import logging
-import os, re, string
+import os, re
+from itertools import chain, groupby
 from difflib import SequenceMatcher
 import pysubs2
-from typing import List, Tuple
+import numpy as np
+from typing import List, Tuple, Iterator, Sequence
 from tqdm import tqdm
+from pydantic import BaseModel
 
-from src.interface import Config, SubFile, Timecode, FilmInfos, Time, Stats
-from src.helpers import right_shift
-from src.sub_files_loader import load_sub_files
+from src.interface import Config, SubFile, CompactEvent, compact_events, Timecode, FilmInfos, Time, Stats, SearchStats
+from src.helpers import right_shift, normalize_sub_text
+from src.sub_files_loader import load_sub_files, episode_cache, loading_workers
+from src.instrumentation import Instrumentation, NULL_INSTRUMENTATION
+from src.workers import spawn_pool, init_worker_logs, take_worker_records, replay_records
+from src.matching import NgramIndex, MinHashLshIndex, shared_lsh_index, QuickRatioEngine, LengthIndex, CombineIndex, AlignmentCandidate, align, is_continuation
 
 
 # TODO in conf ?
@@ -21,149 +27,587 @@ SINGLE_SIM = 0.98
 COMBINE_SIM = 0.94
 TEST_COMBINE_REQ = 1.2# 0.35 #1
 
+# to increase when a change of the search gives different timecodes, invalidates the timecodes cache
+# (test_algorithm_version_of_the_timecodes records the timecodes of each version)
+ALGORITHM_VERSION = 1
+
+# events under this similarity can't start a match nor a combine, the search skips them
+SCAN_SIM = min(REQ_SIM, TEST_COMBINE_REQ)
+
+# "dp" engine: lowest similarity of a candidate, number of candidates kept per film line
+DP_MIN_SIM = NOTFOUND_SIM
+# "dp" engine: events after each candidate of the previous line scored for the next line
+DP_FOLLOWING = 4
+
 logger = logging.getLogger(__name__)
 
+
+class MatchStep(BaseModel):
+    """Result of the search of one film line and of the run extended from it"""
+    start: int # film line searched
+    end: int # next film line to search
+    state: tuple # search state before the search (see TimecodesFinder.search_state)
+    next_state: tuple
+    timecodes: List[Timecode]
+    stats: Stats
+    runs: List[int] = [] # length of the runs matched, recorded in the instrumentation when the step is kept
+
+
 class TimecodesFinder:
-    def __init__(self, config: Config, film_sub_name: str):        
+    def __init__(self, config: Config, film_sub_name: str, instrumentation: Instrumentation = NULL_INSTRUMENTATION):        
         self.config = config
+        self.instrumentation = instrumentation
         film_sub_path = os.path.join(config.films_path, film_sub_name)
-        self.films_subs = pysubs2.load(film_sub_path, encoding="utf-8")
+        self.films_subs: List[CompactEvent] = compact_events(pysubs2.load(film_sub_path, encoding="utf-8").events)
         self.film_sub_name = film_sub_name
         self.film_infos: FilmInfos = config.get_film_info(film_sub_name)
 
-        self.fr_subs: List[SubFile] = load_sub_files(config.fr_subs_path, self.film_infos.covered_episodes)
+        self.fr_subs: List[SubFile] = load_sub_files(config.fr_subs_path, self.film_infos.covered_episodes, cache=episode_cache(config), workers=loading_workers(config))
+
+        # sort and normalize once, every similarity computation then works on the normalized texts
+        self.films_subs.sort(key=lambda e: e.start)
+        self.films_normalized: List[str] = [normalize_sub_text(event.text) for event in self.films_subs]
+        for sub_file in self.fr_subs:
+            sub_file.events.sort(key=lambda e: e.start)
+            sub_file.normalize_texts()
+
+        self.ngram_index: NgramIndex = None
+        if config.matching.candidate_index == "ngram":
+            self.ngram_index = NgramIndex(self.fr_subs)
+
+        self.lsh_index: MinHashLshIndex = None
+        if config.matching.candidate_index == "lsh":
+            self.lsh_index = shared_lsh_index(config)
+
+        self.length_index = LengthIndex({sub_file.path: sub_file.normalized_texts for sub_file in self.fr_subs})
+
+        self.combine_index: CombineIndex = None
+        if config.matching.combine:
+            self.combine_index = CombineIndex(self.fr_subs, self.films_subs, self.instrumentation)
+
+        self.quick_ratio_engine: QuickRatioEngine = None
+        if config.matching.similarity_backend == "numpy":
+            self.quick_ratio_engine = QuickRatioEngine(self.fr_subs)
+
+        self.fr_subs_by_episode: dict[int, SubFile] = {}
+        self.fr_subs_by_path: dict[str, SubFile] = {}
+        for sub_file in self.fr_subs:
+            self.fr_subs_by_episode.setdefault(sub_file.episode_number, sub_file)
+            self.fr_subs_by_path[sub_file.path] = sub_file
+
+        self.progress_bar: tqdm = tqdm(disable=True)
+
+        # search state, the previous film line not found and the (episode, event index) right after
+        # the last matched run, where the locality search starts
+        self.previous_not_found_sub: str = ""
+        self.cursor: Tuple[SubFile, int] = None
+        # paths of the episodes of the last matched runs, most recent last ("adaptive" episode order only)
+        self.recent_episodes: List[str] = []
+        self.locality_tried = False
+        self.in_fallback = False
 
     def find_timecodes(self, progressbarPosition: int) -> Tuple[List[Timecode], Stats]:
-        i = len(self.film_sub_name)//2
+        if self.config.matching.engine == "dp":
+            return self.find_timecodes_dp(progressbarPosition)
+
+        if self.config.matching.film_chunks > 1:
+            return self.find_timecodes_parallel(progressbarPosition)
+
+        stats: Stats = Stats(str(self.film_infos.number), len(self.films_subs))
+        timecodes: List[Timecode] = list(self.iter_timecodes(progressbarPosition, stats))
+        return timecodes, stats
+
+    def stream_timecodes(self, progressbarPosition: int) -> Tuple[Iterator[Timecode], Stats]:
+        """Timecodes yielded as soon as their run is closed, the stats are complete once they are all consumed
+
+        Only the serial greedy search streams, the dp and chunked searches yield everything at the end
+        """
+        if self.config.matching.engine == "dp" or self.config.matching.film_chunks > 1:
+            timecodes, stats = self.find_timecodes(progressbarPosition)
+            return iter(timecodes), stats
+
+        stats: Stats = Stats(str(self.film_infos.number), len(self.films_subs))
+        return self.iter_timecodes(progressbarPosition, stats), stats
+
+    def iter_timecodes(self, progressbarPosition: int, stats: Stats) -> Iterator[Timecode]:
+        """Serial greedy search of the whole film, adds what it finds to stats"""
         printName = self.film_sub_name[0:(len(self.film_sub_name)//2)]
         
         logger.info(f"Finding timecodes for {self.film_sub_name}")
 
+        self.progress_bar = tqdm(total=len(self.films_subs), desc=f"Find timecodes {printName}", unit="sub", position=progressbarPosition, leave=False)
+        self.reset_search()
+
+        i = 0
+        while i < len(self.films_subs):
+            step = self.find_step(i)
+            stats.add(step.stats)
+            self.record_runs(step)
+            i = step.end
+            yield from step.timecodes
+
+        self.log_search_stats(stats)
+
+    def find_timecodes_parallel(self, progressbarPosition: int) -> Tuple[List[Timecode], Stats]:
+        """Same result as the serial find_timecodes, the film is cut in chunks searched in worker processes
+
+        Every worker searches its chunk from a fresh search state. A search only depends on the film
+        line it starts from and on the search state (previous not found line, locality cursor, recent
+        episodes), so once
+        the serial walk reaches a step of the next chunk with the same line and state, the rest of the
+        chunk is the serial result. Steps at the chunk boundaries are searched again until they converge.
+
+        Every worker is a spawned interpreter that loads the film and the covered episodes again, about half
+        a second before it searches: the chunks only pay off with idle cores and a film whose serial search
+        takes several seconds (python backend, no candidate index, many covered episodes). The counters of
+        the workers include the steps searched again here.
+        """
+        printName = self.film_sub_name[0:(len(self.film_sub_name)//2)]
+
+        length = len(self.films_subs)
+        chunk_size = max(1, -(-length // self.config.matching.film_chunks))
+        bounds = [(start, min(length, start + chunk_size)) for start in range(0, length, chunk_size)]
+
+        stats: Stats = Stats(str(self.film_infos.number), length)
+        if len(bounds) < 2:
+            # an empty or one line film is a single chunk, no worker to spawn
+            return list(self.iter_timecodes(progressbarPosition, stats)), stats
+
+        logger.info(f"Finding timecodes for {self.film_sub_name} in {len(bounds)} chunks")
         timecodes: List[Timecode] = []
+        recomputed = 0
+
+        def add_step(step: MatchStep):
+            timecodes.extend(step.timecodes)
+            stats.add(step.stats)
+            self.record_runs(step)
+
+        self.progress_bar = tqdm(total=length, desc=f"Find timecodes {printName}", unit="sub", position=progressbarPosition, leave=False)
+        self.reset_search()
+
+        workers = self.config.workers if self.config.workers > 0 else os.cpu_count()
+        with spawn_pool(max(1, min(workers, len(bounds) - 1)), init_worker_logs) as executor:
+            # the first chunk is searched here while the workers search the others
+            futures = [executor.submit(find_chunk_steps, self.config, self.film_sub_name, start, stop, self.instrumentation.enabled) for start, stop in bounds[1:]]
+
+            i = 0
+            for k, (start, stop) in enumerate(bounds):
+                chunk_steps: List[MatchStep] = []
+                if k > 0:
+                    chunk_steps, report, records = futures[k - 1].result()
+                    replay_records(records)
+                    self.instrumentation.merge(report)
+                speculated = {(step.start, step.state): index for index, step in enumerate(chunk_steps)}
+
+                while i < stop:
+                    index = speculated.get((i, self.search_state()))
+                    if index is not None:
+                        for step in chunk_steps[index:]:
+                            add_step(step)
+                            self.progress_bar.update(step.end - step.start)
+                        i = chunk_steps[-1].end
+                        self.set_search_state(chunk_steps[-1].next_state)
+                        break
+
+                    step = self.find_step(i)
+                    add_step(step)
+                    i = step.end
+                    if k > 0:
+                        recomputed += 1
+
+        logger.info(f"{len(bounds)} chunks stitched, {recomputed} searches done again at the chunk boundaries")
+        self.log_search_stats(stats)
+        return timecodes, stats
+
+    def find_timecodes_dp(self, progressbarPosition: int) -> Tuple[List[Timecode], Stats]:
+        """Align the whole film on the covered episodes at once instead of the greedy search
+
+        Every film line is scored against the DP_FOLLOWING events after each candidate of the previous
+        line, and against the top-k of the candidate index when there is one. Without an index the whole
+        corpus is only scanned where none of these events is over REQ_SIM, at the start of a run, so
+        the scoring stays O(film lines x band) apart from these anchors. Every line keeps its `band` best
+        candidates over DP_MIN_SIM, plus the events following the candidates of the previous line with
+        the same shift, then the best alignment is found by dynamic programming (see matching.alignment)
+        in O(film lines x band).
+        """
+        printName = self.film_sub_name[0:(len(self.film_sub_name)//2)]
+        logger.info(f"Finding timecodes for {self.film_sub_name} with the dp engine")
+
+        band = self.config.matching.band
         stats: Stats = Stats(str(self.film_infos.number), len(self.films_subs))
+        progress_bar = tqdm(total=len(self.films_subs), desc=f"Find timecodes {printName}", unit="sub", position=progressbarPosition, leave=False)
+
+        lines: List[List[AlignmentCandidate]] = []
+        for i, film_sub in enumerate(self.films_subs):
+            film_middle = film_sub.start + (film_sub.end - film_sub.start) // 2
+
+            scored: dict[tuple[str, int], Tuple[SubFile, int, float]] = {}
+
+            def blocks() -> Iterator[Tuple[SubFile, Sequence[int]]]:
+                yield from self.following_blocks(lines[-1] if lines else [])
+                # score_blocks asks for the next block once the matches of the previous ones are scored
+                has_index = self.ngram_index is not None or self.lsh_index is not None
+                if has_index or max((similarity for _, _, similarity in scored.values()), default=0) <= REQ_SIM:
+                    yield from self.full_candidates(i)
+
+            # one search per film line, the stats compare with the greedy engine
+            for sub_file, j, similarity in self.score_blocks(i, blocks(), DP_MIN_SIM, stats.search):
+                scored[(sub_file.path, j)] = (sub_file, j, similarity)
+
+            candidates = [
+                AlignmentCandidate(sub_file.path, j, similarity, film_middle - self.middle_time(sub_file, j))
+                for sub_file, j, similarity in scored.values()
+            ]
+            candidates = sorted(candidates, key=lambda c: c.similarity, reverse=True)[:band]
+
+            # keep the runs going on lines too different from the french one, like the greedy search does
+            known = {(c.path, c.j) for c in candidates}
+            for previous in (lines[-1] if lines else []):
+                sub_file = self.fr_subs_by_path[previous.path]
+                j = previous.j + 1
+                if j < len(sub_file.events) and (previous.path, j) not in known and right_shift(film_sub, sub_file.events[j], previous.shift):
+                    similarity = self.normalized_similarity(self.films_normalized[i], sub_file.normalized_texts[j])
+                    candidates.append(AlignmentCandidate(previous.path, j, similarity, film_middle - self.middle_time(sub_file, j)))
+                    known.add((previous.path, j))
+
+            lines.append(candidates)
+            progress_bar.update(1)
 
-        previous_not_found_sub: str = ""
-        single_sub_best_sim: tuple[pysubs2.SSAEvent, float, str] = (None, -1, None)
-        
-        # bool correspond to skip next film_sub because it was already found using combine
-        combine_sim_best: tuple[pysubs2.SSAEvent, float, str, int, bool] = (None, -1, None, 0, False)
-        self.films_subs.events.sort(key=lambda e: e.start)
+        timecodes: List[Timecode] = []
+        run_start: AlignmentCandidate = None
+        previous: AlignmentCandidate = None
 
-        progressBar = tqdm(total=len(self.films_subs), desc=f"Find timecodes {printName}", unit="sub", position=progressbarPosition, leave=False)
+        for film_sub, chosen in zip(self.films_subs, align(lines)):
+            if chosen is None:
+                stats.not_found += 1
+                stats.subs_not_found.append(film_sub.text)
+                logger.warning(f"Sub \"{film_sub.text}\" not found")
+            else:
+                stats.found += 1
+                logger.info(f"Found sub in {chosen.path} at {Time(self.fr_subs_by_path[chosen.path].events[chosen.j].start)} : \"{film_sub.text}\"")
 
-        i = 0
-        while i < len(self.films_subs):
+            if previous is not None and (chosen is None or not is_continuation(run_start, previous, chosen)):
+                timecodes.append(self.run_timecode(run_start, previous))
+                run_start = None
 
-            film_sub = self.films_subs[i]
-            match_found = False
-            single_sub_best_sim = (None, -1, None)
-            combine_sim_best = (None, -1, None, 0, False)
+            if chosen is not None and run_start is None:
+                run_start = chosen
+            previous = chosen
 
-            logger.info(f"Looking for: {film_sub.text}")
+        if previous is not None:
+            timecodes.append(self.run_timecode(run_start, previous))
 
-            for sub_file in self.fr_subs:
-                ep_fr_sub = sub_file.pysub_file
-                ep_fr_sub.events.sort(key=lambda e: e.start)
-                looking_sub_midle_time = film_sub.start + (film_sub.end - film_sub.start) // 2
+        return timecodes, stats
 
-                j = 0
-                while j < len(ep_fr_sub):
-                    ep_sub = ep_fr_sub[j]
+    def following_blocks(self, previous: List[AlignmentCandidate]) -> List[Tuple[SubFile, List[int]]]:
+        """The DP_FOLLOWING events after each candidate of the previous film line, by episode"""
+        following: dict[str, set[int]] = {}
+        for candidate in previous:
+            length = len(self.fr_subs_by_path[candidate.path].events)
+            following.setdefault(candidate.path, set()).update(range(candidate.j + 1, min(length, candidate.j + 1 + DP_FOLLOWING)))
+        return [(self.fr_subs_by_path[path], sorted(indexes)) for path, indexes in following.items() if indexes]
+
+    def run_timecode(self, first: AlignmentCandidate, last: AlignmentCandidate) -> Timecode:
+        ep_fr_sub = self.fr_subs_by_path[first.path].events
+        return Timecode(
+            start=ep_fr_sub[first.j].start,
+            end=ep_fr_sub[last.j].end,
+            sub_file_name=os.path.basename(first.path),
+            ms_shift=first.shift,
+        )
+
+    def middle_time(self, sub_file: SubFile, j: int) -> int:
+        event = sub_file.events[j]
+        return event.start + (event.end - event.start) // 2
+
+    def record_runs(self, step: MatchStep) -> None:
+        for length in step.runs:
+            self.instrumentation.run(length)
+
+    def find_step(self, i: int) -> MatchStep:
+        """Search the film line i and extend the match, return what was found and the next line to search"""
+        step = MatchStep(start=i, end=i, state=self.search_state(), next_state=(), timecodes=[], stats=Stats(str(self.film_infos.number), 0))
+        timecodes: List[Timecode] = step.timecodes
+        stats: Stats = step.stats
+
+        film_sub = self.films_subs[i]
+        match_found = False
+        single_sub_best_sim = (None, -1, None)
+        combine_sim_best = (None, -1, None, 0, False)
+
+        logger.info(f"Looking for: {film_sub.text}")
+
+        looking_sub_midle_time = film_sub.start + (film_sub.end - film_sub.start) // 2
+
+        for sub_file, j, current_sim in self.scored_candidates(i, stats.search):
+            ep_fr_sub = sub_file.events
+            ep_normalized = sub_file.normalized_texts
+            ep_sub = ep_fr_sub[j]
+
+            if current_sim > TEST_COMBINE_REQ:
+                combine_sim1 = None
+                combine_sim2 = None
+                combine_sim = 0
+                if j + 1 < len(ep_fr_sub):
+                    combine_sim1 = self.srt_similarity(film_sub.text.replace("\\N", ""), f"{ep_sub.text}{ep_fr_sub[j + 1].text}".replace("\\N", ""))
+                    combine_end1 = ep_fr_sub[j + 1].end
+                
+                if i + 1 < len(self.films_subs):
+                    combine_sim2 = self.srt_similarity(f"{film_sub.text}{self.films_subs[i+1].text}".replace("\\N", ""), ep_sub.text.replace("\\N", ""))
+                    conbine_end2 = ep_sub.end
 
-                    current_sim = self.srt_similarity(film_sub.text, ep_sub.text)
-                    
-                    if current_sim > TEST_COMBINE_REQ:
-                        combine_sim1 = None
-                        combine_sim2 = None
-                        combine_sim = 0
-                        if j + 1 < len(ep_fr_sub):
-                            combine_sim1 = self.srt_similarity(film_sub.text.replace("\\N", ""), f"{ep_sub.text}{ep_fr_sub[j + 1].text}".replace("\\N", ""))
-                            combine_end1 = ep_fr_sub[j + 1].end
-                        
-                        if i + 1 < len(self.films_subs):
-                            combine_sim2 = self.srt_similarity(f"{film_sub.text}{self.films_subs[i+1].text}".replace("\\N", ""), ep_sub.text.replace("\\N", ""))
-                            conbine_end2 = ep_sub.end
-
-                        combine_sim = max(combine_sim1 if combine_sim1 else 0, combine_sim2 if combine_sim2 else 0)
-                        if combine_sim1 == combine_sim:
-                            conbine_end = combine_end1
-                            is_skipy = False
-                        else:
-                            conbine_end = conbine_end2
-                            is_skipy = True
+                combine_sim = max(combine_sim1 if combine_sim1 else 0, combine_sim2 if combine_sim2 else 0)
+                if combine_sim1 == combine_sim:
+                    conbine_end = combine_end1
+                    is_skipy = False
+                else:
+                    conbine_end = conbine_end2
+                    is_skipy = True
 
-                        if combine_sim > COMBINE_SIM and combine_sim > combine_sim_best[1]:
-                            combine_sim_best = (ep_sub, combine_sim, sub_file.path, conbine_end, is_skipy)
+                if combine_sim > COMBINE_SIM and combine_sim > combine_sim_best[1]:
+                    combine_sim_best = (ep_sub, combine_sim, sub_file.path, conbine_end, is_skipy)
 
-                    if  current_sim > REQ_SIM:
+            if  current_sim > REQ_SIM:
 
-                        if single_sub_best_sim[1] < current_sim:
-                            single_sub_best_sim = (ep_sub, current_sim, sub_file.path)
+                if single_sub_best_sim[1] < current_sim:
+                    single_sub_best_sim = (ep_sub, current_sim, sub_file.path)
 
-                        _, avg_similarity = self.next_five_similarity(i, self.films_subs, j, ep_fr_sub)
+                _, avg_similarity = self.next_five_similarity(i, j, sub_file)
+                
+                if avg_similarity > AVG_SIM:
+                    start = j
+                    sub_shift = looking_sub_midle_time - (ep_fr_sub[start].start + (ep_fr_sub[start].end - ep_fr_sub[start].start) // 2)
+                    
+                    matching = True
+                    match_using_shift = 0
+                    run_start = i
+
+                    while matching and i < len(self.films_subs) and j < len(ep_fr_sub):
+                        film_sub = self.films_subs[i]
+                        ep_sub = ep_fr_sub[j]
                         
-                        if avg_similarity > AVG_SIM:
-                            start = j
-                            sub_shift = looking_sub_midle_time - (ep_fr_sub[start].start + (ep_fr_sub[start].end - ep_fr_sub[start].start) // 2)
+                        if self.normalized_similarity(self.films_normalized[i], ep_normalized[j]) > REQ_SIM and right_shift(film_sub, ep_sub, sub_shift):
+                            logger.info(f"Found sub in {sub_file.path} at {Time(ep_sub.start)} : \"{film_sub.text}\"")
+                            stats.found += 1
+
+                            if self.previous_not_found_sub != "":
+                                if self.normalized_similarity(normalize_sub_text(self.previous_not_found_sub), ep_normalized[j - 1]) > NOTFOUND_SIM or right_shift(film_sub, ep_fr_sub[j - 1], sub_shift):
+                                    start = j - 1
+                                self.previous_not_found_sub = ""
                             
-                            matching = True
-                            match_using_shift = 0
-
-                            while matching and i < len(self.films_subs) and j < len(ep_fr_sub):
-                                film_sub = self.films_subs[i]
-                                ep_sub = ep_fr_sub[j]
-                                
-                                if self.srt_similarity(film_sub.text, ep_sub.text) > REQ_SIM and right_shift(film_sub, ep_sub, sub_shift):
-                                    logger.info(f"Found sub in {sub_file.path} at {Time(ep_sub.start)} : \"{film_sub.text}\"")
-                                    stats.found += 1
-
-                                    if previous_not_found_sub != "":
-                                        if self.srt_similarity(previous_not_found_sub, ep_fr_sub[j - 1].text) > NOTFOUND_SIM or right_shift(film_sub, ep_fr_sub[j - 1], sub_shift):
-                                            start = j - 1
-                                        previous_not_found_sub = ""
-                                    
-                                    progressBar.update(1)
-                                    i += 1
-                                    j += 1
-                                elif right_shift(film_sub, ep_sub, sub_shift) and match_using_shift < 3:
-                                    match_using_shift += 1
-                                    stats.found += 1
-                                    i += 1
-                                    j += 1
-                                    progressBar.update(1)
-                                else:
-                                    matching = False
-
-                            end = j - 1  # j is incremented one extra time
-                            
-                            timecodes.append(Timecode(
-                                start=ep_fr_sub[start].start,
-                                end=ep_fr_sub[end].end,
-                                sub_file_name=os.path.basename(sub_file.path),
-                                ms_shift=sub_shift,
-                            ))
-
-                            match_found = True
-                            break  
-
-                    j += 1
-
-                if match_found:
-                    break
-
-            if not match_found:
-                previous_not_found_sub, is_skip = self.handle_no_match(single_sub_best_sim, combine_sim_best, film_sub, timecodes, stats)
-                progressBar.update(1)
-                if is_skip:
-                    i += 1
-                    stats.found += 1
-                
+                            self.progress_bar.update(1)
+                            i += 1
+                            j += 1
+                        elif right_shift(film_sub, ep_sub, sub_shift) and match_using_shift < 3:
+                            match_using_shift += 1
+                            stats.found += 1
+                            i += 1
+                            j += 1
+                            self.progress_bar.update(1)
+                        else:
+                            matching = False
+
+                    end = j - 1  # j is incremented one extra time
+                    step.runs.append(i - run_start)
+                    
+                    timecodes.append(Timecode(
+                        start=ep_fr_sub[start].start,
+                        end=ep_fr_sub[end].end,
+                        sub_file_name=os.path.basename(sub_file.path),
+                        ms_shift=sub_shift,
+                    ))
+                    self.cursor = (sub_file, j)
+                    if self.config.matching.episode_order == "adaptive":
+                        self.recent_episodes = (self.recent_episodes + [sub_file.path])[-self.config.matching.recent_matches:]
+
+                    match_found = True
+                    break  
+
+        if self.locality_tried:
+            if match_found and not self.in_fallback:
+                stats.search.locality_hits += 1
+            else:
+                stats.search.locality_misses += 1
+
+        if not match_found and self.combine_index is not None and single_sub_best_sim[1] < SINGLE_SIM:
+            combine_sim_best = self.combine_search(i, combine_sim_best, stats.search)
+
+        if not match_found:
+            self.previous_not_found_sub, is_skip = self.handle_no_match(single_sub_best_sim, combine_sim_best, film_sub, timecodes, stats)
+            self.progress_bar.update(1)
+            if is_skip:
                 i += 1
+                stats.found += 1
             
-
-        return timecodes, stats
-
-    def handle_no_match(self, single_sub_best_sim: Tuple[pysubs2.SSAEvent, float, str], combine_sim_best: Tuple[pysubs2.SSAEvent, float, str, int, bool], film_sub: pysubs2.SSAEvent, timecodes: List[Timecode], stats: Stats) -> tuple[str, bool]:
+            i += 1
+
+        step.end = i
+        step.next_state = self.search_state()
+        return step
+
+    def reset_search(self) -> None:
+        self.previous_not_found_sub = ""
+        self.cursor = None
+        self.recent_episodes = []
+
+    def search_state(self) -> tuple:
+        """Everything a search depends on besides the film line it starts from
+
+        The cursor is only used by the locality search, out of it two chunks converge whatever their cursors
+        """
+        cursor = (self.cursor[0].path, self.cursor[1]) if self.cursor is not None and self.config.matching.search == "locality" else None
+        return (self.previous_not_found_sub, cursor, tuple(self.recent_episodes))
+
+    def set_search_state(self, state: tuple) -> None:
+        self.previous_not_found_sub, cursor, recent_episodes = state
+        self.recent_episodes = list(recent_episodes)
+        self.cursor = (self.fr_subs_by_path[cursor[0]], cursor[1]) if cursor is not None else None
+
+    def log_search_stats(self, stats: Stats) -> None:
+        if self.config.matching.search == "locality":
+            logger.info(f"Locality search: {stats.search.locality_hits} hits, {stats.search.locality_misses} fallbacks to the full search")
+        logger.info(f"Similarities: {stats.search.comparisons} computed, {stats.search.skipped_comparisons} skipped on length")
+        if stats.search.searched_lines > 0:
+            logger.info(f"Episodes visited per searched line: {stats.search.episodes_visited / stats.search.searched_lines:.2f}")
+        if self.combine_index is not None:
+            logger.info(f"Combine search: {stats.search.combine_found} lines found in {stats.search.combine_searches} searches")
+
+    def scored_candidates(self, i: int, search_stats: SearchStats) -> Iterator[Tuple[SubFile, int, float]]:
+        """Yield the candidates of the film line i whose similarity is over SCAN_SIM, with that similarity"""
+        return self.score_blocks(i, self.candidates(i), SCAN_SIM, search_stats)
+
+    def score_blocks(self, i: int, blocks: Iterator[Tuple[SubFile, Sequence[int]]], threshold: float, search_stats: SearchStats) -> Iterator[Tuple[SubFile, int, float]]:
+        film_normalized = self.films_normalized[i]
+        blocks = self.prune_blocks(blocks, len(film_normalized), threshold, search_stats)
+
+        if self.quick_ratio_engine is not None:
+            film_counts = self.quick_ratio_engine.encode(film_normalized)
+            for sub_file, indexes in blocks:
+                if not len(indexes):
+                    continue
+                similarities = self.quick_ratio_engine.similarities(film_counts, len(film_normalized), sub_file, indexes)
+                self.instrumentation.count("similarity_calls", len(indexes))
+                for k in np.flatnonzero(similarities > threshold):
+                    yield sub_file, indexes[k], float(similarities[k])
+            return
+
+        for sub_file, indexes in blocks:
+            ep_normalized = sub_file.normalized_texts
+            for j in indexes:
+                similarity = self.normalized_similarity(film_normalized, ep_normalized[j])
+                if similarity > threshold:
+                    yield sub_file, j, similarity
+
+    def prune_blocks(self, blocks: Iterator[Tuple[SubFile, Sequence[int]]], length: int, threshold: float, search_stats: SearchStats) -> Iterator[Tuple[SubFile, Sequence[int]]]:
+        """Remove from the blocks the events too short or too long to be over the threshold (exact, see LengthIndex)"""
+        search_stats.searched_lines += 1
+        visited: set[str] = set()
+
+        for sub_file, indexes in blocks:
+            if sub_file.path not in visited:
+                visited.add(sub_file.path)
+                search_stats.episodes_visited += 1
+
+            kept = self.length_index.prune(sub_file.path, indexes, length, threshold)
+            search_stats.comparisons += len(kept)
+            self.instrumentation.count("candidate_pairs", len(kept))
+            search_stats.skipped_comparisons += len(indexes) - len(kept)
+            yield sub_file, kept
+
+    def candidates(self, i: int) -> Iterator[Tuple[SubFile, Sequence[int]]]:
+        """Yield blocks of (episode, event indexes) to compare with the film line i, in search order"""
+        visited: dict[str, set[int]] = {}
+        self.locality_tried = self.config.matching.search == "locality" and self.cursor is not None
+        self.in_fallback = False
+
+        if self.locality_tried:
+            for sub_file, indexes in self.locality_candidates():
+                visited.setdefault(sub_file.path, set()).update(indexes)
+                yield sub_file, indexes
+            self.in_fallback = True
+
+        for sub_file, indexes in self.full_candidates(i):
+            seen = visited.get(sub_file.path)
+            if seen:
+                indexes = [j for j in indexes if j not in seen]
+            if indexes:
+                yield sub_file, indexes
+
+    def locality_candidates(self) -> Iterator[Tuple[SubFile, Sequence[int]]]:
+        """Window after (then before) the cursor in its episode, then the neighbouring episode numbers"""
+        sub_file, j = self.cursor
+        window = self.config.matching.locality_window
+        length = len(sub_file.events)
+
+        yield sub_file, list(chain(range(j, min(length, j + window)), range(max(0, j - window), min(j, length))))
+
+        for distance in range(1, self.config.matching.locality_episodes + 1):
+            for number in (sub_file.episode_number + distance, sub_file.episode_number - distance):
+                neighbour = self.fr_subs_by_episode.get(number)
+                if neighbour is not None:
+                    yield neighbour, range(len(neighbour.events))
+
+    def full_candidates(self, i: int) -> Iterator[Tuple[SubFile, Sequence[int]]]:
+        film_normalized = self.films_normalized[i]
+
+        # lines too short to have a n-gram are still searched everywhere
+        if self.ngram_index is not None and len(film_normalized) >= self.ngram_index.n:
+            positions = self.ngram_index.candidates(film_normalized, self.config.matching.top_k)
+            yield from self.scheduled_blocks({sub_file.path: [j for _, j in group] for sub_file, group in groupby(positions, key=lambda position: position[0])})
+            return
+
+        if self.lsh_index is not None and len(film_normalized) >= self.lsh_index.n:
+            positions = self.lsh_index.candidates(film_normalized, self.config.matching.top_k, self.fr_subs_by_path.keys())
+            yield from self.scheduled_blocks({path: [j for _, j in group] for path, group in groupby(positions, key=lambda position: position[0])})
+            return
+
+        for sub_file in self.episode_schedule():
+            yield sub_file, range(len(sub_file.events))
+
+    def scheduled_blocks(self, blocks: dict[str, List[int]]) -> Iterator[Tuple[SubFile, Sequence[int]]]:
+        """Blocks of candidates keyed by episode path, yielded in the episode schedule order"""
+        for sub_file in self.episode_schedule():
+            indexes = blocks.get(sub_file.path)
+            if indexes:
+                yield sub_file, indexes
+
+    def episode_schedule(self) -> List[SubFile]:
+        """Order in which the full search visits the episodes
+
+        loading order (by episode number), or with the "adaptive" episode order: the episode of the last match, its
+        neighbouring episode numbers, the episodes ranked by matches among the recent ones, the others
+        """
+        if self.config.matching.episode_order != "adaptive" or not self.recent_episodes:
+            return self.fr_subs
+
+        last = self.fr_subs_by_path[self.recent_episodes[-1]]
+        schedule = [last]
+        for distance in range(1, self.config.matching.locality_episodes + 1):
+            for number in (last.episode_number + distance, last.episode_number - distance):
+                neighbour = self.fr_subs_by_episode.get(number)
+                if neighbour is not None and neighbour.path != last.path:
+                    schedule.append(neighbour)
+
+        # stable sort, episodes never matched recently stay in loading order
+        scheduled = {sub_file.path for sub_file in schedule}
+        others = [sub_file for sub_file in self.fr_subs if sub_file.path not in scheduled]
+        schedule.extend(sorted(others, key=lambda sub_file: -self.recent_episodes.count(sub_file.path)))
+        return schedule
+
+    def combine_search(self, i: int, combine_sim_best: Tuple[CompactEvent, float, str, int, bool], search_stats: SearchStats) -> Tuple[CompactEvent, float, str, int, bool]:
+        """Best combine match of the film line i in the combine index, if better than combine_sim_best"""
+        search_stats.combine_searches += 1
+        match = self.combine_index.search(i, self.episode_schedule(), max(COMBINE_SIM, combine_sim_best[1]), search_stats)
+        if match is None:
+            return combine_sim_best
+
+        sub_file, j, combine_sim, is_skipy = match
+        ep_fr_sub = sub_file.events
+        search_stats.combine_found += 1
+        # a split line ends with the French event, a merged one with the French event after it
+        return (ep_fr_sub[j], combine_sim, sub_file.path, ep_fr_sub[j].end if is_skipy else ep_fr_sub[j + 1].end, is_skipy)
+
+    def handle_no_match(self, single_sub_best_sim: Tuple[CompactEvent, float, str], combine_sim_best: Tuple[CompactEvent, float, str, int, bool], film_sub: CompactEvent, timecodes: List[Timecode], stats: Stats) -> tuple[str, bool]:
         if single_sub_best_sim[1] >= SINGLE_SIM:
             timecodes.append(Timecode(
                 start=single_sub_best_sim[0].start,
@@ -172,6 +616,7 @@ class TimecodesFinder:
                 ms_shift=film_sub.start - single_sub_best_sim[0].start,
             ))
             stats.found += 1
+            self.instrumentation.count("fallback_single_found")
             logger.info(f"Single found sub \"{film_sub.text}\" in {single_sub_best_sim[2]} at {Time(single_sub_best_sim[0].start)}")
             return "", False
         elif combine_sim_best[1] > COMBINE_SIM:
@@ -182,22 +627,26 @@ class TimecodesFinder:
                 ms_shift=film_sub.start - combine_sim_best[0].start,
             ))
             stats.found += 1
+            self.instrumentation.count("fallback_combine_found")
             logger.info(f"Combine found sub \"{film_sub.text}\" in {combine_sim_best[2]} at {Time(combine_sim_best[0].start)}")
             return "", combine_sim_best[4]
         else:
             stats.not_found += 1
             stats.subs_not_found.append(film_sub.text)
+            self.instrumentation.count("fallback_not_found")
             logger.warning(f"Sub \"{film_sub.text}\" not found")
             previous_not_found_sub = film_sub.text
 
         return previous_not_found_sub, False
 
-    def next_five_similarity(self, i: int, films_subs: List[pysubs2.SSAFile], j: int, ep_fr_sub: pysubs2.SSAFile) -> Tuple[int, float]:
+    def next_five_similarity(self, i: int, j: int, sub_file: SubFile) -> Tuple[int, float]:
+        self.instrumentation.count("next_five_calls")
+        ep_fr_sub = sub_file.events
         total_similarity = 0
-        nb = min(5, len(films_subs) - i, len(ep_fr_sub) - j)
+        nb = min(5, len(self.films_subs) - i, len(ep_fr_sub) - j)
 
         for k in range(nb):
-            similarity = self.srt_similarity(films_subs[i + k].text, ep_fr_sub[j + k].text)
+            similarity = self.normalized_similarity(self.films_normalized[i + k], sub_file.normalized_texts[j + k])
             
             if (similarity < 0.70 and self.is_all_upper_or_number(ep_fr_sub[j + k].text)):
                 nb -= 1
@@ -210,13 +659,37 @@ class TimecodesFinder:
         return nb, total_similarity / nb
 
     def srt_similarity(self, s1: str, s2: str) -> float:
-        s1 = re.sub(r'\{.*?\}', '', s1).lower().strip().translate(str.maketrans('', '', string.punctuation))
-        s2 = re.sub(r'\{.*?\}', '', s2).lower().strip().translate(str.maketrans('', '', string.punctuation))
-        
         # s1 = re.sub(r'\{.*?\}', '', s1).lower().strip().translate(str.maketrans('', '', string.punctuation+"’…"))
         # s2 = re.sub(r'\{.*?\}', '', s2).lower().strip().translate(str.maketrans('', '', string.punctuation+"’…"))
+        return self.normalized_similarity(normalize_sub_text(s1), normalize_sub_text(s2))
+
+    def normalized_similarity(self, s1: str, s2: str) -> float:
+        """Same as srt_similarity but for texts already passed through normalize_sub_text"""
+        self.instrumentation.count("similarity_calls")
         return SequenceMatcher(None, s1, s2).quick_ratio()
     
     def is_all_upper_or_number(self, s: str):
         s =  re.sub(r'\{.*?\}', '', s)
         return all((c.isupper() or c.isdigit() or not c.isalpha()) for c in s)
+
+
+def find_chunk_steps(config: Config, film_sub_name: str, start: int, stop: int, instrumented: bool) -> Tuple[List[MatchStep], dict, List[logging.LogRecord]]:
+    """Worker of find_timecodes_parallel, search the film lines [start, stop[ from a fresh search state
+
+    Returns the steps, the report of the worker when the film is instrumented (its runs are in the steps)
+    and the records it logged
+    """
+    take_worker_records()
+    instrumentation = Instrumentation() if instrumented else NULL_INSTRUMENTATION
+    with instrumentation.phase("match/chunk-load"):
+        finder = TimecodesFinder(config, film_sub_name, instrumentation)
+    finder.reset_search()
+
+    steps: List[MatchStep] = []
+    i = start
+    with instrumentation.phase("match/chunk-search"):
+        while i < stop:
+            step = finder.find_step(i)
+            steps.append(step)
+            i = step.end
+    return steps, instrumentation.report(), take_worker_records()
@@ -0,0 +1,60 @@
+import logging, multiprocessing
+from typing import Callable, List, Optional
+from concurrent.futures import ProcessPoolExecutor
+
+
+class LogRecordsCollector(logging.Handler):
+    """Keep the log records of a worker process so they can be sent back with its result"""
+    def __init__(self) -> None:
+        super().__init__(logging.DEBUG)
+        self.records: list[logging.LogRecord] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        # format now, args and tracebacks may not be picklable
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        self.records.append(record)
+
+
+# set once per worker process by init_worker_logs
+worker_logs: LogRecordsCollector = None
+
+
+def init_worker_logs() -> None:
+    """Pool initializer: the logs of the worker are kept for the parent instead of being lost"""
+    global worker_logs
+    worker_logs = LogRecordsCollector()
+
+    root_logger = logging.getLogger()
+    for handler in root_logger.handlers[:]:
+        root_logger.removeHandler(handler)
+    root_logger.setLevel(logging.DEBUG)
+    root_logger.addHandler(worker_logs)
+
+    def log_rich(self, message, level=logging.INFO):
+        self.log(level, message)
+    logging.Logger.rich = log_rich
+
+
+def take_worker_records() -> List[logging.LogRecord]:
+    """Records logged by the worker since the last call, sent back with the result of its task"""
+    records, worker_logs.records = worker_logs.records, []
+    return records
+
+
+def replay_records(records: List[logging.LogRecord]) -> None:
+    """Log the records of a worker in the parent, through its handlers"""
+    for record in records:
+        logging.getLogger(record.name).handle(record)
+
+
+def spawn_pool(workers: int, initializer: Optional[Callable] = None, initargs: tuple = ()) -> ProcessPoolExecutor:
+    """Process pool of spawned workers, used by every process pool of the translation
+
+    The films and languages can be processed in threads: a forked worker could copy a lock held by another
+    thread (progress bars, logging) and hang on it
+    """
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"), initializer=initializer, initargs=initargs)
@@ -1,4 +1,4 @@
-import os, json
+import os, json, random, string, pysubs2
 
 from src.interface import Config
 
@@ -10,4 +10,67 @@ def load_test_conf() -> Config:
         config = Config(**json_data)
     
     return config
-    
\ No newline at end of file
+    
+
+def corpus_line(rng: random.Random) -> str:
+    """Line of words made of five letters of its own, two lines share few characters so only its own line is similar"""
+    letters = rng.sample(string.ascii_lowercase, 5)
+    return " ".join("".join(rng.choice(letters) for _ in range(rng.randint(2, 7))) for _ in range(rng.randint(3, 8))).capitalize()
+
+
+def make_corpus(root: str, seed=0, episodes=4, lines=120, languages=("en",)) -> Config:
+    """French episodes, the languages to build and a film cut from runs of the episodes
+
+    The film keeps runs of 5 to 30 lines of each episode in order, shifted, with a few lines dropped,
+    retouched or invented, like the films the search is tuned for
+    """
+    rng = random.Random(seed)
+    for folder in ["fr", "films"] + [os.path.join("to-build", language) for language in languages]:
+        os.makedirs(os.path.join(root, folder))
+
+    film = pysubs2.SSAFile()
+    film_time = 2000
+    for number in range(1, episodes + 1):
+        fr = pysubs2.SSAFile()
+        fr.info["PlayResX"], fr.info["PlayResY"] = "1920", "1080"
+        t = rng.randint(1000, 5000)
+        for _ in range(lines):
+            duration = rng.randint(800, 4000)
+            t += rng.randint(50, 1500)
+            text = corpus_line(rng) + rng.choice([" !", " ?", ".", ""])
+            fr.append(pysubs2.SSAEvent(start=t, end=t + duration, text=text))
+            t += duration
+        fr.save(os.path.join(root, "fr", f"Serie {number:02d}.ass"))
+        for language in languages:
+            subs = pysubs2.SSAFile()
+            subs.info = dict(fr.info)
+            subs.events = [pysubs2.SSAEvent(start=event.start, end=event.end, text=f"{language} {event.text.lower()}") for event in fr]
+            subs.save(os.path.join(root, "to-build", language, f"Serie {number:02d}.ass"))
+
+        k = 0
+        while k < lines:
+            run = fr.events[k:k + rng.randint(5, 30)]
+            k += len(run)
+            if rng.random() < 0.2:
+                continue
+            shift = film_time - run[0].start
+            for event in run:
+                r = rng.random()
+                if r < 0.05:
+                    continue
+                text = event.text.replace("e", "é", 1) + "," if r < 0.1 else event.text
+                film.append(pysubs2.SSAEvent(start=event.start + shift, end=event.end + shift, text=text))
+            film_time = run[-1].end + shift + 2000
+            if rng.random() < 0.2:
+                film.append(pysubs2.SSAEvent(start=film_time, end=film_time + 1500, text="Ligne inventée pour le film"))
+                film_time += 3000
+    film.save(os.path.join(root, "films", "Film 01.ass"))
+
+    return Config(**{
+        "films-path": os.path.join(root, "films"),
+        "fr-subs-path": os.path.join(root, "fr"),
+        "subs-to-translate-path": os.path.join(root, "to-build"),
+        "save-path": os.path.join(root, "out"),
+        "timecodes-cache": False,
+        "films-to-build": [{"file-name": "Film 01.ass", "number": 1, "covered-episodes": [f"1-{episodes}"]}],
+    })
@@ -0,0 +1,25 @@
+import random, pysubs2
+
+from src.ass_writer import write_ass
+
+
+def test_write_ass_same_bytes_as_pysubs2(tmp_path):
+    rng = random.Random(5)
+    subs = pysubs2.SSAFile()
+    subs.info["PlayResX"] = 1920
+    subs.info["PlayResY"] = "1080"
+    subs.styles["Sign"] = pysubs2.SSAStyle(fontname="Arial Black", fontsize=52.5, bold=True, italic=False, scalex=100.0, angle=-12.25,
+                                           primarycolor=pysubs2.Color(255, 0, 12, 128), alignment=pysubs2.Alignment.TOP_LEFT, marginv=70)
+    subs.styles["Empty"] = pysubs2.SSAStyle()
+    for k in range(300):
+        start = rng.randrange(-500, 4000000)
+        subs.append(pysubs2.SSAEvent(start=start, end=start + rng.randrange(0, 5000), style=rng.choice(["Default", "Sign"]), layer=rng.choice([0, 1]),
+                                     name=rng.choice(["", "Asta"]), marginl=rng.choice([0, 15]), effect=rng.choice(["", "Banner;5"]),
+                                     type=rng.choice(["Dialogue", "Dialogue", "Comment"]), text=rng.choice(["Salut\\Nça va ?", "{\\an8}é à ü", str(k)])))
+
+    expected_path, path = tmp_path / "expected.ass", tmp_path / "written.ass"
+    # written first, pysubs2 adds ScriptType to the info
+    write_ass(str(path), subs.info, subs.styles, subs.events)
+    subs.save(str(expected_path), encoding="utf-8")
+
+    assert path.read_bytes() == expected_path.read_bytes()
@@ -0,0 +1,59 @@
+import os, json, logging
+from concurrent.futures import ThreadPoolExecutor
+
+from src.interface import Config, Stats
+from src.instrumentation import Instrumentation, NullInstrumentation, create_instrumentation, save_instrumentation_report
+
+
+def test_instrumentation_report(tmp_path):
+    config = Config(**{"films-path": str(tmp_path / "films"), "save-path": str(tmp_path / "out"), "instrumentation": True})
+    instrumentation = create_instrumentation(config)
+    assert isinstance(instrumentation, Instrumentation) and instrumentation.enabled
+
+    instrumentation.count("similarity_calls", 3)
+    instrumentation.count("similarity_calls")
+    instrumentation.run(4)
+    instrumentation.run(4)
+    for _ in range(2):
+        with instrumentation.phase("match/search"):
+            pass
+
+    report = instrumentation.report()
+    assert report["counters"] == {"similarity_calls": 4}
+    assert report["run-lengths"] == {4: 2}
+    assert report["phases"]["match/search"]["calls"] == 2
+
+    logging.Logger.rich = lambda self, message, level=logging.INFO: None
+    stats = Stats("1", 10)
+    stats.instrumentation = report
+    save_instrumentation_report(config, [stats, None])
+    with open(os.path.join(config.save_path, "instrumentation.json"), encoding="utf-8") as file:
+        assert json.load(file)["1"]["counters"] == {"similarity_calls": 4}
+
+
+def test_instrumentation_shared_by_threads():
+    instrumentation = Instrumentation()
+
+    def record():
+        for _ in range(10000):
+            instrumentation.count("similarity_calls")
+            with instrumentation.phase("build/slice"):
+                pass
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        for future in [executor.submit(record) for _ in range(4)]:
+            future.result()
+
+    report = instrumentation.report()
+    assert report["counters"] == {"similarity_calls": 40000}
+    assert report["phases"]["build/slice"]["calls"] == 40000
+
+
+def test_instrumentation_disabled():
+    instrumentation = create_instrumentation(Config())
+    assert isinstance(instrumentation, NullInstrumentation)
+
+    instrumentation.count("similarity_calls")
+    with instrumentation.phase("match/search"):
+        instrumentation.run(3)
+    assert instrumentation.report() == {}
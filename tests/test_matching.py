@@ -0,0 +1,253 @@
+import os, re, logging, pysubs2
+from difflib import SequenceMatcher
+
+from src.interface import Config, SubFile, SearchStats, Stats
+from src.timecode_finder import TimecodesFinder
+from src.instrumentation import Instrumentation
+from src.helpers import normalize_sub_text
+from src.matching import NgramIndex, MinHashLshIndex, shared_lsh_index, QuickRatioEngine, LengthIndex, CombineIndex, AlignmentCandidate, align, is_continuation
+from tests.helper import make_corpus
+
+
+def make_sub_file(path: str, texts: list[str]) -> SubFile:
+    subs = pysubs2.SSAFile()
+    for k, text in enumerate(texts):
+        subs.append(pysubs2.SSAEvent(start=k * 2000, end=k * 2000 + 1500, text=text))
+    sub_file = SubFile(pysub_file=subs, path=path)
+    sub_file.normalize_texts()
+    return sub_file
+
+
+def test_ngram_index_candidates():
+    ep1 = make_sub_file("Serie 01.ass", ["Asta, reveille-toi !", "Je deviendrai empereur-mage", "Yuno est parti"])
+    ep2 = make_sub_file("Serie 02.ass", ["Les Taureaux Noirs", "Je deviendrai l'empereur-mage !", "Quoi ?"])
+    index = NgramIndex([ep1, ep2])
+
+    candidates = index.candidates(ep1.normalized_texts[1], top_k=2)
+
+    # both lines about the empereur-mage, returned in episode then event order
+    assert [(sub_file.episode_number, j) for sub_file, j in candidates] == [(1, 1), (2, 1)]
+    assert index.candidates("zzz", top_k=2) == []
+
+
+def test_quick_ratio_engine_same_scores():
+    texts = ["Asta, reveille-toi !", "{\\i1}Je deviendrai empereur-mage{\\i0}", "", "Quoi ?", "YUNO EST PARTI..."]
+    ep = make_sub_file("Serie 03.ass", texts)
+    engine = QuickRatioEngine([ep])
+
+    for film_text in texts + ["Je deviendrai l'empereur-mage ! ça", "Ω"]:
+        film_normalized = normalize_sub_text(film_text)
+        scores = engine.similarities(engine.encode(film_normalized), len(film_normalized), ep, range(len(texts)))
+        expected = [SequenceMatcher(None, film_normalized, normalized).quick_ratio() for normalized in ep.normalized_texts]
+
+        assert scores.tolist() == expected
+        assert engine.similarities(engine.encode(film_normalized), len(film_normalized), ep, [3, 1]).tolist() == [expected[3], expected[1]]
+
+
+def test_align_prefers_continuous_runs():
+    ep1, ep2 = "Serie 01.ass", "Serie 02.ass"
+    lines = [
+        [AlignmentCandidate(ep1, 4, 0.95, 1000)],
+        # ep2 is a bit more similar but would break the run of ep1
+        [AlignmentCandidate(ep2, 10, 0.86, -5000), AlignmentCandidate(ep1, 5, 0.85, 1000)],
+        [AlignmentCandidate(ep1, 6, 0.9, 1000)],
+        [],
+    ]
+
+    chosen = align(lines)
+
+    assert [(c.path, c.j) for c in chosen[:3]] == [(ep1, 4), (ep1, 5), (ep1, 6)]
+    assert chosen[3] is None
+
+
+def test_continuation_keeps_the_shift_of_the_run():
+    ep = "Serie 01.ass"
+    first = AlignmentCandidate(ep, 4, 0.95, 1000)
+    previous = AlignmentCandidate(ep, 5, 0.95, 1100)
+
+    assert is_continuation(first, previous, AlignmentCandidate(ep, 6, 0.95, 1050))
+    # each line drifts less than the tolerance from the previous one, but the run is written with the shift of first
+    assert not is_continuation(first, previous, AlignmentCandidate(ep, 6, 0.95, 1200))
+    assert not is_continuation(first, previous, AlignmentCandidate(ep, 8, 0.95, 1000))
+
+
+def test_lsh_index_candidates():
+    ep1 = make_sub_file("Serie 01.ass", ["Asta, reveille-toi !", "Je deviendrai empereur-mage", "Yuno est parti"])
+    ep2 = make_sub_file("Serie 02.ass", ["Les Taureaux Noirs", "Je deviendrai l'empereur-mage !", "Quoi ?"])
+    index = MinHashLshIndex([ep1, ep2], bands=20, rows=2)
+
+    candidates = index.candidates(ep1.normalized_texts[1], top_k=2)
+
+    assert candidates == [("Serie 01.ass", 1), ("Serie 02.ass", 1)]
+    assert index.candidates(ep1.normalized_texts[1], top_k=2, paths={"Serie 02.ass"}) == [("Serie 02.ass", 1)]
+    assert index.candidates("", top_k=2) == []
+
+
+def test_shared_lsh_index_rebuilt_on_edited_files(tmp_path):
+    config = make_corpus(str(tmp_path))
+    index = shared_lsh_index(config)
+    assert shared_lsh_index(config) is index
+
+    ep_path = os.path.join(config.fr_subs_path, "Serie 01.ass")
+    ep = pysubs2.load(ep_path)
+    ep.events = ep.events[:60]
+    ep.save(ep_path)
+
+    rebuilt = shared_lsh_index(config)
+    assert rebuilt is not index
+    assert len(rebuilt.positions) == len(index.positions) - 60
+
+
+def test_length_index_prune_is_exact():
+    texts = ["", "a", "Quoi ?", "Asta, reveille-toi !", "Je deviendrai empereur-mage", "Yuno", "Les Taureaux Noirs du royaume de Clover"]
+    ep = make_sub_file("Serie 04.ass", texts)
+    index = LengthIndex({ep.path: ep.normalized_texts})
+
+    for film_text in texts + ["Je deviendrai l'empereur-mage !"]:
+        film_normalized = normalize_sub_text(film_text)
+        for threshold in [0.65, 0.8, 1.2]:
+            reachable = [j for j, normalized in enumerate(ep.normalized_texts) if SequenceMatcher(None, film_normalized, normalized).quick_ratio() > threshold]
+            kept = index.prune(ep.path, range(len(texts)), len(film_normalized), threshold)
+
+            assert set(reachable) <= set(kept)
+            assert list(kept) == sorted(kept)
+            assert index.prune(ep.path, [6, 3, 4], len(film_normalized), threshold) == [j for j in [6, 3, 4] if j in kept]
+
+
+def test_combine_index_merged_and_split_lines():
+    ep = make_sub_file("Serie 05.ass", ["Asta, reveille-toi !", "On part au village.", "Les Taureaux Noirs", "Je deviendrai l'empereur-mage !"])
+    film = make_sub_file("Film 01.ass", ["Asta, reveille-toi ! On part au village.", "Je deviendrai", "l'empereur-mage !", ""])
+    instrumentation = Instrumentation()
+    index = CombineIndex([ep], film.events, instrumentation)
+    stats = SearchStats()
+
+    # the film merged two French lines
+    sub_file, j, similarity, is_split = index.search(0, [ep], 0.94, stats)
+    assert (sub_file.path, j, is_split) == ("Serie 05.ass", 0, False) and similarity > 0.94
+
+    # the film split one French line
+    sub_file, j, similarity, is_split = index.search(1, [ep], 0.94, stats)
+    assert (sub_file.path, j, is_split) == ("Serie 05.ass", 3, True) and similarity > 0.94
+
+    assert index.search(3, [ep], 0.94, stats) is None
+    assert stats.comparisons > 0
+    assert instrumentation.report()["counters"]["similarity_calls"] == stats.comparisons
+
+
+def find_timecodes(config: Config, **matching) -> tuple[list[dict], Stats]:
+    """Timecodes and stats of the film of make_corpus, searched with these matching options"""
+    config = config.model_copy(deep=True)
+    for name, value in matching.items():
+        setattr(config.matching, name, value)
+    timecodes, stats = TimecodesFinder(config, "Film 01.ass").find_timecodes(0)
+    return [timecode.model_dump() for timecode in timecodes], stats
+
+
+def test_locality_search_same_as_full_search(tmp_path):
+    config = make_corpus(str(tmp_path))
+    expected, expected_stats = find_timecodes(config)
+    timecodes, stats = find_timecodes(config, search="locality")
+
+    assert timecodes == expected
+    assert (stats.found, stats.not_found, stats.subs_not_found) == (expected_stats.found, expected_stats.not_found, expected_stats.subs_not_found)
+    # most runs continue around the last match, the others fall back to the full search
+    assert stats.search.locality_hits > stats.search.locality_misses > 0
+    assert stats.search.comparisons < expected_stats.search.comparisons
+    assert expected_stats.search.locality_hits == expected_stats.search.locality_misses == 0
+
+
+def test_film_chunks_same_as_serial_search(tmp_path, caplog):
+    config = make_corpus(str(tmp_path))
+    with caplog.at_level(logging.INFO, logger="src.timecode_finder"):
+        expected, expected_stats = find_timecodes(config)
+    searches = caplog.text.count("Looking for:")
+
+    searched_again = 0
+    for film_chunks in [3, 9]:
+        with caplog.at_level(logging.INFO, logger="src.timecode_finder"):
+            caplog.clear()
+            timecodes, stats = find_timecodes(config, film_chunks=film_chunks)
+
+        assert timecodes == expected
+        assert stats.model_dump() == expected_stats.model_dump()
+        # the logs of the workers are replayed here, with the searches done again
+        assert caplog.text.count("Looking for:") >= searches
+        searched_again += int(re.search(rf"{film_chunks} chunks stitched, (\d+) searches done again", caplog.text).group(1))
+    # runs cross chunk boundaries: their steps are searched again before the chunks converge
+    assert searched_again > 0
+
+
+def test_film_chunks_instrumentation_same_runs_as_serial(tmp_path):
+    config = make_corpus(str(tmp_path))
+    reports = []
+    for film_chunks in [1, 3]:
+        config.matching.film_chunks = film_chunks
+        instrumentation = Instrumentation()
+        TimecodesFinder(config, "Film 01.ass", instrumentation).find_timecodes(0)
+        reports.append(instrumentation.report())
+    serial, chunked = reports
+
+    assert chunked["run-lengths"] == serial["run-lengths"]
+    # the counters of the workers are merged, the steps searched again included
+    assert chunked["counters"]["candidate_pairs"] >= serial["counters"]["candidate_pairs"]
+    assert chunked["phases"]["match/chunk-search"]["calls"] == 2
+
+
+def test_film_chunks_of_a_short_film(tmp_path):
+    config = make_corpus(str(tmp_path))
+    film_path = os.path.join(config.films_path, "Film 01.ass")
+    film = pysubs2.load(film_path)
+
+    for lines in [1, 0]:
+        film.events = film.events[:lines]
+        film.save(film_path)
+        expected, expected_stats = find_timecodes(config)
+        timecodes, stats = find_timecodes(config, film_chunks=4)
+
+        assert len(timecodes) == lines
+        assert timecodes == expected
+        assert stats.model_dump() == expected_stats.model_dump()
+
+
+def test_dp_engine_scores_a_band_not_the_corpus(tmp_path):
+    config = make_corpus(str(tmp_path))
+    _, greedy_stats = find_timecodes(config)
+    _, stats = find_timecodes(config, engine="dp")
+
+    assert stats.found >= greedy_stats.found
+    # every film line is searched once, like in the greedy search
+    assert stats.search.searched_lines == stats.total_to_find
+    # the whole corpus is only scanned at the starts of the runs, far from a full scan per film line
+    corpus_events = 4 * 120
+    assert stats.search.comparisons < stats.total_to_find * corpus_events / 10
+
+
+def test_dp_engine_splits_runs_on_shift_change(tmp_path):
+    config = make_corpus(str(tmp_path))
+    fr = pysubs2.load(os.path.join(config.fr_subs_path, "Serie 01.ass"))
+    # a 10 s scene without subtitles is inserted in the middle of the episode
+    film = pysubs2.SSAFile()
+    for k, event in enumerate(fr.events[:40]):
+        shift = 5000 if k < 20 else 15000
+        film.append(pysubs2.SSAEvent(start=event.start + shift, end=event.end + shift, text=event.text))
+    film.save(os.path.join(config.films_path, "Film 01.ass"))
+
+    expected, _ = find_timecodes(config)
+    timecodes, _ = find_timecodes(config, engine="dp")
+
+    assert [(timecode["start"], timecode["end"], timecode["shift"]["time"]) for timecode in timecodes] == [
+        (fr.events[0].start, fr.events[19].end, 5000),
+        (fr.events[20].start, fr.events[39].end, 15000),
+    ]
+    assert timecodes == expected
+
+
+def test_adaptive_episode_order_same_as_listdir(tmp_path):
+    config = make_corpus(str(tmp_path))
+    expected, expected_stats = find_timecodes(config)
+    timecodes, stats = find_timecodes(config, episode_order="adaptive")
+
+    assert timecodes == expected
+    assert (stats.found, stats.not_found) == (expected_stats.found, expected_stats.not_found)
+    # the episode of the last match is searched first
+    assert stats.search.episodes_visited < expected_stats.search.episodes_visited
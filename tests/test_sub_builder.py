@@ -0,0 +1,155 @@
+import os, random, pytest, pysubs2
+
+from src.interface import Config, SubFile, Timecode
+from src.sub_builder import EpisodeEvents, SubBuilder
+from src.sub_traductor import build_languages, stream_build
+from src.timecode_finder import TimecodesFinder
+from src.instrumentation import NULL_INSTRUMENTATION
+from tests.helper import make_corpus
+
+
+def scan_window(events: list[pysubs2.SSAEvent], start: int, end: int):
+    """Window read like build_subs always did: in file order until the first event ending after end"""
+    inside, crossing = [], None
+    for event in events:
+        if event.end > end:
+            if event.start < end:
+                crossing = event
+            break
+        if event.end >= start:
+            inside.append(event)
+    return inside, crossing
+
+
+def test_episode_events_window_same_as_scan():
+    rng = random.Random(1)
+    subs = pysubs2.SSAFile()
+    for k in range(200):
+        # mostly in order, some events out of order or overlapping like in real files
+        start = k * 1000 + rng.choice([0, 0, 0, -3000, 500, 7000])
+        subs.append(pysubs2.SSAEvent(start=max(0, start), end=max(0, start) + rng.randint(0, 2500), text=str(k)))
+    sub_file = SubFile(pysub_file=subs, path="Serie 01.ass")
+    episode = EpisodeEvents(sub_file)
+
+    for _ in range(500):
+        start = rng.randrange(-2000, 205000)
+        end = start + rng.randrange(0, 20000)
+        inside, crossing = episode.window(start, end)
+        expected_inside, expected_crossing = scan_window(sub_file.events, start, end)
+
+        # check the events themselves, not only their times
+        assert [id(event) for event in inside] == [id(event) for event in expected_inside]
+        assert crossing is expected_crossing
+
+
+def legacy_remove_duplicate(subs: pysubs2.SSAFile):
+    """remove_duplicate before the linear rewrite, quadratic"""
+    subs.events.sort(key=lambda e: (e.text, e.start, e.end))
+    sub_to_remove = []
+    for i in range(len(subs) - 1):
+        current, next_sub = subs[i], subs[i + 1]
+        if current.text == next_sub.text and current.start == next_sub.start and current.end == next_sub.end:
+            sub_to_remove.append(next_sub)
+            continue
+        if current.text == next_sub.text:
+            if (current.start <= next_sub.start < current.end) or (next_sub.start <= current.start < next_sub.end):
+                sub_to_remove.append(next_sub if (current.end - current.start) >= (next_sub.end - next_sub.start) else current)
+                continue
+        if (current.end - current.start) < 80:
+            sub_to_remove.append(current)
+    for sub in sorted(sub_to_remove, reverse=True):
+        if sub in subs.events:
+            subs.events.remove(sub)
+
+
+def test_remove_duplicate_same_as_legacy():
+    rng = random.Random(2)
+    events = []
+    for k in range(600):
+        start = rng.randrange(0, 20000, 10)
+        # few texts and times so there are exact duplicates, overlaps, short events and same times with other texts
+        events.append(pysubs2.SSAEvent(start=start, end=start + rng.choice([0, 50, 79, 80, 500, 1500]), text=rng.choice(["a", "b", "c", "d"])))
+
+    subs, expected = pysubs2.SSAFile(), pysubs2.SSAFile()
+    subs.events = [event.copy() for event in events]
+    expected.events = [event.copy() for event in events]
+
+    SubBuilder.remove_duplicate(None, subs)
+    legacy_remove_duplicate(expected)
+
+    assert len(subs.events) < len(events)
+    assert [event.as_dict() for event in subs.events] == [event.as_dict() for event in expected.events]
+
+
+def make_languages(root: str, languages: list[str], episodes: int) -> Config:
+    for language in languages:
+        os.makedirs(os.path.join(root, "to-build", language))
+        for number in range(1, episodes + 1):
+            subs = pysubs2.SSAFile()
+            for k in range(50):
+                subs.append(pysubs2.SSAEvent(start=k * 2000, end=k * 2000 + 1500, text=f"{language} {number} {k}"))
+            subs.save(os.path.join(root, "to-build", language, f"Serie {number:02d}.ass"))
+
+    return Config(**{
+        "films-path": os.path.join(root, "films"),
+        "subs-to-translate-path": os.path.join(root, "to-build"),
+        "save-path": os.path.join(root, "out"),
+        "films-to-build": [{"file-name": "Film 01.ass", "number": 1, "covered-episodes": [f"1-{episodes}"]}],
+    })
+
+
+def test_build_languages_parallel_same_as_serial(tmp_path):
+    languages = ["en", "es", "it"]
+    config = make_languages(str(tmp_path), languages, 3)
+    rng = random.Random(3)
+    timecodes = [Timecode(start=start, end=start + rng.randrange(1000, 10000), ms_shift=rng.randrange(-5000, 5000), sub_file_name=f"Serie {rng.randint(1, 3):02d}.ass")
+                 for start in (rng.randrange(0, 90000) for _ in range(40))]
+
+    outputs = {}
+    for build_mode in ["serial", "thread", "process"]:
+        config.build_mode = build_mode
+        build_languages(config, "Film 01.ass", timecodes, 0, NULL_INSTRUMENTATION)
+        outputs[build_mode] = {language: (tmp_path / "out" / language / "Film 01.ass").read_bytes() for language in languages}
+
+    assert outputs["thread"] == outputs["serial"]
+    assert outputs["process"] == outputs["serial"]
+    assert b"Dialogue" in outputs["serial"]["es"]
+
+
+def built_subs(save_path: str, languages: list[str]) -> dict[str, bytes]:
+    with_files = [language for language in languages if os.path.exists(os.path.join(save_path, language, "Film 01.ass"))]
+    return {language: open(os.path.join(save_path, language, "Film 01.ass"), "rb").read() for language in with_files}
+
+
+def test_stream_build_same_as_batch_build(tmp_path):
+    languages = ["en", "es"]
+    config = make_corpus(str(tmp_path), languages=languages)
+    expected_timecodes, expected_stats = TimecodesFinder(config, "Film 01.ass").find_timecodes(0)
+    build_languages(config, "Film 01.ass", expected_timecodes, 0, NULL_INSTRUMENTATION)
+    expected = built_subs(config.save_path, languages)
+
+    config.save_path = str(tmp_path / "stream")
+    timecodes, stats = stream_build(config, TimecodesFinder(config, "Film 01.ass"), 0, NULL_INSTRUMENTATION)
+
+    assert timecodes == expected_timecodes
+    assert stats.model_dump() == expected_stats.model_dump()
+    assert len(expected) == 2 and built_subs(config.save_path, languages) == expected
+
+
+def test_stream_build_writes_nothing_when_the_matching_fails(tmp_path):
+    languages = ["en", "es"]
+    config = make_corpus(str(tmp_path), languages=languages)
+    finder = TimecodesFinder(config, "Film 01.ass")
+    stream, stats = finder.stream_timecodes(0)
+
+    def failing_stream():
+        # a few timecodes reach the builders before the matching fails
+        for k, timecode in enumerate(stream):
+            if k == 5:
+                raise RuntimeError("matching failed")
+            yield timecode
+    finder.stream_timecodes = lambda position: (failing_stream(), stats)
+
+    with pytest.raises(RuntimeError, match="matching failed"):
+        stream_build(config, finder, 0, NULL_INSTRUMENTATION)
+    assert built_subs(config.save_path, languages) == {}
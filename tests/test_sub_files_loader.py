@@ -0,0 +1,228 @@
+import os, random, pysubs2
+
+import src.sub_files_loader
+
+from src.interface import SubFile, compact_events
+from src.sub_files_loader import EpisodeCache, list_sub_files, load_sub_files, create_style_list, is_style_equal
+from src.ass_writer import ass_lines
+from src.ass_reader import read_ass
+
+
+def save_episode(path: str, fontsize: float, text: str):
+    subs = pysubs2.SSAFile()
+    subs.styles["Sign"] = pysubs2.SSAStyle(fontsize=fontsize)
+    for k in range(20):
+        subs.append(pysubs2.SSAEvent(start=k * 1000, end=k * 1000 + 800, text=f"{text} {k}", style="Sign" if k % 2 else "Default"))
+    subs.save(path)
+
+
+def dump(sub_files: list[SubFile]) -> list:
+    return [(sub_file.path, "".join(ass_lines(sub_file.pysub_file.info, sub_file.pysub_file.styles, sub_file.events))) for sub_file in sub_files]
+
+
+def test_episode_cache_loads_same_as_pysubs2(tmp_path):
+    # same style name with other parameters: the events of episode 2 are renamed by styles_in_sub
+    save_episode(str(tmp_path / "Serie 01.ass"), 20, "one")
+    save_episode(str(tmp_path / "Serie 02.ass"), 40, "two")
+    cache = EpisodeCache(1024 * 1024)
+
+    expected = dump(load_sub_files(str(tmp_path), [1, 2], to_build=True))
+    for _ in range(2):
+        assert dump(load_sub_files(str(tmp_path), [1, 2], to_build=True, cache=cache)) == expected
+        # the cache always parses the styles, the matching loads skip them
+        assert dump(load_sub_files(str(tmp_path), [2], cache=cache)) == dump(load_sub_files(str(tmp_path), [2], to_build=True))
+    assert cache.hits == 4 and cache.misses == 2
+
+    # the cached events keep their style, a rewritten file is parsed again
+    save_episode(str(tmp_path / "Serie 02.ass"), 40, "changed")
+    os.utime(tmp_path / "Serie 02.ass", ns=(0, 0))
+    loaded = load_sub_files(str(tmp_path), [2], cache=cache)[0]
+    assert loaded.events[1].style == "Sign" and loaded.events[1].text == "changed 1"
+    assert cache.misses == 3 and len(cache.files) == 2
+
+
+def test_episode_cache_evicts_least_recently_used(tmp_path):
+    for number in range(1, 4):
+        save_episode(str(tmp_path / f"Serie {number:02d}.ass"), 20, str(number))
+    paths = [str(tmp_path / f"Serie {number:02d}.ass") for number in range(1, 4)]
+    sizes = EpisodeCache(1024 * 1024)
+    for path in paths:
+        sizes.load(path)
+
+    # room for two episodes, the third evicts the least recently used
+    cache = EpisodeCache(sizes.files[paths[0]][2] + sizes.files[paths[2]][2])
+    for path in [paths[0], paths[1], paths[0], paths[2]]:
+        cache.load(path)
+    assert list(cache.files) == [paths[0], paths[2]]
+    assert cache.size <= cache.budget
+
+    empty = EpisodeCache(0)
+    assert len(empty.load(paths[0]).events) == 20 and not empty.files
+
+
+def legacy_create_style_list(files: list[tuple[str, pysubs2.SSAFile]]) -> dict[str, pysubs2.SSAStyle]:
+    """create_style_list before the hash-keyed rewrite, on pysubs2 files: linear style lookups and a pass over the events per rename"""
+    styles = {}
+    for basename, subs in files:
+        to_modify = []
+        for style in subs.styles:
+            if style in styles:
+                if not is_style_equal(styles[style], subs.styles[style]):
+                    to_modify.append([style, basename[:-4] + '_' + style])
+                    styles[basename[:-4] + '_' + style] = subs.styles[style]
+            else:
+                styles[style] = subs.styles[style]
+        for names in to_modify:
+            subs.rename_style(names[0], names[1])
+    return styles
+
+
+def test_create_style_list_same_as_legacy():
+    def make_files() -> list[tuple[str, pysubs2.SSAFile]]:
+        rng = random.Random(4)
+        files = []
+        for number in range(1, 9):
+            subs = pysubs2.SSAFile()
+            names = ["Default"] + [f"Sign{k}" for k in rng.sample(range(30), 12)]
+            for name in names:
+                # few parameter values so most styles are equal to the style of the same name in another file
+                subs.styles[name] = pysubs2.SSAStyle(fontsize=rng.choice([40, 40, 48]), bold=rng.random() < 0.2, marginv=rng.choice([10, 10, 30]))
+            for k in range(100):
+                subs.append(pysubs2.SSAEvent(start=k * 1000, end=k * 1000 + 500, text=str(k), style=rng.choice(names)))
+            files.append((f"Serie {number:02d}.ass", subs))
+        return files
+
+    sub_files = [SubFile(pysub_file=subs, path=basename) for basename, subs in make_files()]
+    expected_files = make_files()
+    styles = create_style_list(sub_files)
+    expected = legacy_create_style_list(expected_files)
+
+    assert len(styles) > 13
+    assert list(styles) == list(expected)
+    assert all(is_style_equal(styles[name], expected[name]) for name in styles)
+    for sub_file, (_, expected_file) in zip(sub_files, expected_files):
+        assert dump([sub_file])[0][1] == expected_file.to_string("ass")
+
+
+def test_compact_events_round_trip():
+    events = [
+        pysubs2.SSAEvent(start=0, end=1500, text="Salut\\N{\\i1}toi", style="Default"),
+        pysubs2.SSAEvent(start=1500, end=2000, text="Note", style="Sign", layer=2, name="Asta", marginl=10, effect="Banner;5", type="Comment"),
+        pysubs2.SSAEvent(start=3000, end=4000, text="Fin", style="Default"),
+    ]
+    compact = compact_events(events)
+
+    for event, compact_event in zip(events, compact):
+        assert compact_event.to_ssa().equals(event)
+        assert compact_event.copy().to_ssa().equals(event)
+    # the fields the matching and building never change are stored once
+    assert compact[0].extra is compact[2].extra
+    assert compact[1].layer == 2 and compact[1].type == "Comment"
+
+
+# lines pysubs2 parses without defaults: odd spacing, commas in the text, a comment event, negative and long timestamps
+TRICKY_ASS = """﻿[Script Info]
+; Script generated by hand
+Title: Épisode: 3
+ScriptType: v4.00+
+
+[Aegisub Project Garbage]
+Video File: episode.mkv
+
+[V4+ Styles]
+Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
+Style: Default,Arial,20,&H00FFFFFF,&H000000FF,&H00000000,&H00000000,0,0,0,0,100,100,0,0,1,2,2,2,10,10,10,1
+Style: Sign, Verdana ,32.5,&H00FFFFFF,&H000000FF,&H00000000,&H80000000,-1,0,0,0,100,100,0,0,1,2,2,8,10,10,10,1
+
+[Events]
+Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+Dialogue: 0,0:00:01.00,0:00:02.50,Default,,0,0,0,,Salut, toi,\\N{\\i1}ça va ?{\\i0}
+Comment: 1,0:00:02.50,0:00:03.00,Sign,Asta,10,0,0,Banner;5,Note
+Dialogue:  2, -0:00:00.50 ,0:00:04,Default,,0,0,0,,  espaces gardés  
+Dialogue: 0,9:02:03.456,9:02:04.4,Sign,,0,0,0,,
+Dialogue: 0,0:00:05.00,0:00:06.00,Default,,0,0,0,,Fin\r
+"""
+
+
+def load_with_pysubs2(path: str) -> SubFile:
+    return SubFile(pysub_file=pysubs2.load(path, encoding="utf-8"), path=path)
+
+
+def test_read_ass_same_as_pysubs2(tmp_path):
+    path = str(tmp_path / "Serie 03.ass")
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        file.write(TRICKY_ASS.replace("\n", "\r\n"))
+    save_episode(str(tmp_path / "Serie 04.ass"), 20, "quatre")
+
+    for sub_path in [path, str(tmp_path / "Serie 04.ass")]:
+        sub_file = read_ass(sub_path)
+        expected = load_with_pysubs2(sub_path)
+        assert [event.to_ssa() for event in sub_file.events] == [event.to_ssa() for event in expected.events]
+        assert [(event.text, event.extra) for event in sub_file.events] == [(event.text, event.extra) for event in expected.events]
+        assert sub_file.pysub_file.aegisub_project == expected.pysub_file.aegisub_project
+        assert dump([sub_file]) == dump([expected])
+
+    # the matching only reads the events
+    assert read_ass(path, styles=False).pysub_file.styles == {}
+    assert len(read_ass(path, styles=False).events) == 5
+
+
+def test_read_ass_falls_back_to_pysubs2(tmp_path):
+    fonts = tmp_path / "Serie 05.ass"
+    fonts.write_text(TRICKY_ASS + "\n[Fonts]\nfontname: font.ttf\nABCDEF\n", encoding="utf-8")
+    short_line = tmp_path / "Serie 06.ass"
+    short_line.write_text(TRICKY_ASS + "Dialogue: 0,0:00:07.00,0:00:08.00,Default\n", encoding="utf-8")
+    srt = tmp_path / "Serie 07.ass"
+    srt.write_text("1\n00:00:01,000 --> 00:00:02,000\nSalut\n", encoding="utf-8")
+
+    for path in [fonts, short_line, srt]:
+        assert read_ass(str(path)) is None
+    # the fallback loads them like before
+    loaded = {sub_file.path: len(sub_file.events) for sub_file in load_sub_files(str(tmp_path), [5, 6, 7], to_build=True)}
+    assert loaded == {str(path): len(load_with_pysubs2(str(path)).events) for path in [fonts, short_line, srt]}
+
+
+def test_parallel_loading_same_as_serial(tmp_path):
+    for number in range(1, 6):
+        save_episode(str(tmp_path / f"Serie {number:02d}.ass"), 20 + number % 2 * 20, str(number))
+    # not an episode: logged and skipped by both loaders
+    (tmp_path / "Serie 06.ass").write_text("Not a subtitle file", encoding="utf-8")
+    covered = [1, 2, 3, 4, 6]
+
+    for to_build in [False, True]:
+        expected = dump(load_sub_files(str(tmp_path), covered, to_build=to_build))
+        assert len(expected) == 4
+        assert dump(load_sub_files(str(tmp_path), covered, to_build=to_build, workers=2)) == expected
+    # the parsing processes are spawned once for all the loads
+    pool = src.sub_files_loader.shared_parse_pool
+    assert pool is not None
+
+    cache = EpisodeCache(1024 * 1024)
+    cache.load(str(tmp_path / "Serie 02.ass"))
+    expected = dump(load_sub_files(str(tmp_path), covered, to_build=True))
+    assert dump(load_sub_files(str(tmp_path), covered, to_build=True, cache=cache, workers=2)) == expected
+    # the episode already cached is not loaded again, the others are cached
+    assert cache.hits == 1 and len(cache.files) == 4
+    assert dump(load_sub_files(str(tmp_path), covered, to_build=True, cache=cache)) == expected
+    assert src.sub_files_loader.shared_parse_pool is pool
+
+
+def test_sub_files_listed_by_episode_number(tmp_path):
+    for name in ["Serie 10.ass", "Serie 9.ass", "Serie 100.ass", "Serie 11.srt"]:
+        (tmp_path / name).write_text("", encoding="utf-8")
+
+    assert [os.path.basename(sub_path) for sub_path in list_sub_files(str(tmp_path), [9, 10, 11, 100])] == ["Serie 9.ass", "Serie 10.ass", "Serie 100.ass"]
+
+
+def parse_and_exit(sub_path: str, data: bytes, styles=True):
+    os._exit(1)
+
+
+def test_parallel_loading_survives_a_dead_worker(tmp_path, monkeypatch):
+    for number in range(1, 4):
+        save_episode(str(tmp_path / f"Serie {number:02d}.ass"), 20, str(number))
+    expected = dump(load_sub_files(str(tmp_path), [1, 2, 3], to_build=True))
+
+    # the parsing processes die: the parent loads the episodes itself
+    monkeypatch.setattr(src.sub_files_loader, "parse_sub_file_bytes", parse_and_exit)
+    assert dump(load_sub_files(str(tmp_path), [1, 2, 3], to_build=True, workers=2)) == expected
@@ -1,10 +1,11 @@
-import os, tempfile, logging
+import os, shutil, tempfile, logging, multiprocessing
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 
-from tests.helper import load_test_conf
+from tests.helper import load_test_conf, make_corpus
 
 from src.interface import Config, Timecode, Time
-from src.sub_traductor import translate_subs_treaded, translate_subs_single_thread, print_cut_timecodes 
+from src.sub_traductor import translate_subs_treaded, translate_subs_single_thread, print_cut_timecodes, init_process_worker, process_in_worker
 
 
 def test_config():
@@ -86,3 +87,31 @@ def test_sub_traductor_single_thread():
             assert event.plaintext == expect_event.plaintext
         
         assert result.equals(expected) == True
+
+
+def test_process_mode_reports_a_film_it_cannot_match(tmp_path):
+    config = make_corpus(str(tmp_path))
+    shutil.rmtree(config.fr_subs_path)
+
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=init_process_worker, initargs=(config,)) as executor:
+        stats, records = executor.submit(process_in_worker, "Film 01.ass", 0).result()
+
+    assert stats.film == "1"
+    assert stats.total_to_find == -1
+    assert any(record.levelno == logging.WARNING for record in records)
+
+
+def test_process_mode_skips_a_film_without_stats(tmp_path, monkeypatch):
+    config = make_corpus(str(tmp_path))
+    config.parallel_mode = "process"
+    config.workers = 1
+    # the worker returns no stats when there is nothing to build
+    shutil.rmtree(config.subs_to_translate_path)
+    printed = []
+    monkeypatch.setattr(logging.Logger, "rich", lambda self, message, level=logging.INFO: None, raising=False)
+    monkeypatch.setattr("src.sub_traductor.Stats.print_stats", lambda results: printed.append(results))
+
+    translate_subs_treaded(config)
+
+    assert printed == [[]]
@@ -0,0 +1,81 @@
+import os, json, logging, hashlib, pysubs2
+
+from src.interface import Config, Timecode, Stats
+from src.timecode_cache import TimecodesCache
+from src.config_actions import generate_config
+from src.timecode_finder import TimecodesFinder, ALGORITHM_VERSION
+from tests.helper import make_corpus
+
+
+# digest of the timecodes of make_corpus by ALGORITHM_VERSION: a change of the search failing this test bumps it
+CORPUS_TIMECODES = {
+    1: "16ef19c2a6b42e05cdd63af362d752e1",
+}
+
+
+def write_subs(path: str, texts: list[str]):
+    subs = pysubs2.SSAFile()
+    for k, text in enumerate(texts):
+        subs.append(pysubs2.SSAEvent(start=k * 2000, end=k * 2000 + 1500, text=text))
+    subs.save(path)
+
+
+def test_timecodes_cache(tmp_path):
+    for folder in ["films", "fr"]:
+        os.makedirs(tmp_path / folder)
+    film_name = "Serie Kai 01.ass"
+    write_subs(str(tmp_path / "films" / film_name), ["Asta !", "Yuno !"])
+    write_subs(str(tmp_path / "fr" / "Serie 01.ass"), ["Asta !", "Yuno !"])
+    write_subs(str(tmp_path / "fr" / "Serie 09.ass"), ["not covered"])
+
+    config = Config(**{
+        "films-path": str(tmp_path / "films"),
+        "fr-subs-path": str(tmp_path / "fr"),
+        "films-to-build": [{"file-name": film_name, "number": 1, "covered-episodes": ["1-2"]}],
+    })
+    assert config.timecodes_cache == False
+    assert config.cache_path == os.path.join(str(tmp_path), ".timecodes-cache")
+
+    cache = TimecodesCache(config, film_name)
+    assert cache.load() is None
+
+    stats = Stats("1", 2)
+    stats.found = 1
+    stats.not_found = 1
+    stats.subs_not_found.append("Yuno !")
+    cache.save([Timecode(start=0, end=1500, ms_shift=250, sub_file_name="Serie 01.ass")], stats)
+
+    timecodes, cached_stats = TimecodesCache(config, film_name).load()
+    assert [(t.start, t.end, t.shift.time, t.episode_number) for t in timecodes] == [(0, 1500, 250, 1)]
+    assert cached_stats == stats
+
+    # speed only options and not covered episodes keep the key, covered french subs change it
+    config.matching.similarity_backend = "numpy"
+    write_subs(str(tmp_path / "fr" / "Serie 09.ass"), ["still not covered"])
+    assert TimecodesCache(config, film_name).key == cache.key
+
+    write_subs(str(tmp_path / "fr" / "Serie 01.ass"), ["Asta !", "Noelle !"])
+    assert TimecodesCache(config, film_name).load() is None
+
+
+def test_generated_config_cache_path(tmp_path, monkeypatch):
+    os.makedirs(tmp_path / "films")
+    write_subs(str(tmp_path / "films" / "Serie Kai 01.ass"), ["Asta !"])
+    answers = iter([str(tmp_path / "films")])
+    monkeypatch.setattr("src.config_actions.Prompt.ask", lambda *args, default=None, **kwargs: next(answers, default))
+    monkeypatch.setattr("src.config_actions.ask_for_fandom_serie", lambda: None)
+    monkeypatch.setattr(logging.Logger, "rich", lambda self, message, level=logging.INFO: None, raising=False)
+
+    generate_config(str(tmp_path / "generated"))
+
+    with open(tmp_path / "generated.conf", encoding="utf-8") as file:
+        # next to the films folder entered, not the default one
+        assert json.load(file)["cache-path"] == f"{tmp_path}/.timecodes-cache"
+
+
+def test_algorithm_version_of_the_timecodes(tmp_path):
+    config = make_corpus(str(tmp_path))
+    timecodes, _ = TimecodesFinder(config, "Film 01.ass").find_timecodes(0)
+
+    digest = hashlib.md5("\n".join(timecode.model_dump_json() for timecode in timecodes).encode()).hexdigest()
+    assert CORPUS_TIMECODES.get(ALGORITHM_VERSION) == digest, "the search gives other timecodes, bump ALGORITHM_VERSION"